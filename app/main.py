@@ -9,7 +9,6 @@ import os
 from app.routers.auth_router import router as auth_router
 from app.middleware.auth_middleware import JWTAuthMiddleware
 from app.routers.textbook_router import router as textbook_router
-from app.utils.vector_processor import search_similar_chunks
 from app.routers.qa_router import router as qa_router
 from app.routers.bots_router import router as bots_router
 from app.routers.analytics_router import router as analytics_router
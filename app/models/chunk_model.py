@@ -62,3 +62,44 @@ async def get_user_chunks_by_subject(user_email: str, subject: str = None):
         chunk["_id"] = str(chunk["_id"])
         chunks.append(chunk)
     return chunks
+
+async def upsert_chunk_documents(textbook_id: str, user_email: str, chunks: List[dict]) -> int:
+    """Insert or update individual chunks (each with a "chunk_id") of an existing textbook"""
+    from pymongo import UpdateOne
+    
+    # New chunks inherit the textbook metadata stored on its other chunks
+    template = await database.textbook_chunks.find_one(
+        {"textbook_id": textbook_id, "user_email": user_email},
+        {"textbook_name": 1, "subject": 1, "grade": 1, "description": 1, "original_filename": 1, "file_path": 1}
+    ) or {}
+    template.pop("_id", None)
+    
+    operations = [
+        UpdateOne(
+            {"_id": chunk["chunk_id"], "textbook_id": textbook_id, "user_email": user_email},
+            {
+                "$set": {
+                    "chunk_number": chunk.get("chunk_number", 0),
+                    "content": chunk["content"],
+                    "word_count": len(chunk["content"].split()),
+                    "char_count": len(chunk["content"]),
+                    "page_number": chunk.get("page_number", 1),
+                    "content_type": chunk.get("content_type", "regular"),
+                    "updated_at": datetime.utcnow()
+                },
+                "$setOnInsert": dict(template, created_at=datetime.utcnow())
+            },
+            upsert=True
+        )
+        for chunk in chunks
+    ]
+    if operations:
+        await database.textbook_chunks.bulk_write(operations, ordered=False)
+    return len(operations)
+
+async def delete_chunk_documents(textbook_id: str, user_email: str, chunk_ids: List[str]) -> int:
+    """Delete individual chunks of a textbook"""
+    result = await database.textbook_chunks.delete_many(
+        {"_id": {"$in": list(chunk_ids)}, "textbook_id": textbook_id, "user_email": user_email}
+    )
+    return result.deleted_count
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi import APIRouter, Request, HTTPException, Depends, Query
 from fastapi.security import HTTPBearer
 from fastapi.responses import FileResponse
 from typing import Optional
@@ -7,7 +7,7 @@ from datetime import datetime
 # Import our proper schemas and database functions
 from app.schemas.chat_schemas import (
     MessageType, ChatBotResponse, ChatMessageSend, 
-    ChatConversationResponse, ChatSessionListResponse
+    ChatConversationResponse, ChatSessionListResponse, LibrarySearchResponse
 )
 from app.models.chat_database import (
     create_chat_session_db, save_chat_message_db,
@@ -16,8 +16,12 @@ from app.models.chat_database import (
 )
 
 # Import existing utilities
-from app.utils.vector_processor import search_similar_chunks
-import fitz  # PyMuPDF
+from app.utils.vector_processor import (
+    ahybrid_search_chunks, asearch_user_library, aencode_query, normalize_query, get_textbook_version,
+    get_vector_cache_stats, get_query_cache_stats, get_query_batcher_stats
+)
+from app.utils.answer_cache import answer_cache, ANSWER_CACHE_ENABLED
+from app.utils.lazy_imports import get_fitz
 import base64
 import os
 import re
@@ -89,6 +93,57 @@ async def ask_question_chatbot(
         print(f"📖 Retrieved {len(conversation_history)} previous messages")
         print(f"🔗 Context length: {len(conversation_context)} characters")
         
+        # Standalone questions may be served from the semantic answer cache (no LLM calls)
+        textbook_info = None
+        cache_embedding = None
+        cache_question_key = normalize_query(question)
+        if ANSWER_CACHE_ENABLED and not is_followup_question(question, conversation_context):
+            textbook_info = await get_textbook_metadata(user_email, textbook_id)
+            grade = textbook_info.get("grade", "1") if textbook_info else "1"
+            textbook_version = get_textbook_version(user_email, textbook_id)
+            cache_embedding = await aencode_query(question)
+            
+            cached = answer_cache.lookup(
+                (user_email, textbook_id), grade, textbook_version, cache_embedding, cache_question_key
+            )
+            if cached:
+                cached_answer, cache_similarity = cached
+                print(f"⚡ Answer cache hit (similarity {cache_similarity:.3f})")
+                
+                bot_message_id = await save_chat_message_db(
+                    session_id=session_id,
+                    user_email=user_email,
+                    message_type=MessageType.BOT,
+                    content=cached_answer["answer"],
+                    metadata={
+                        "answer_type": cached_answer["answer_type"],
+                        "educational_image": cached_answer["educational_image"],
+                        "reference_pages": cached_answer["reference_pages"],
+                        "context_used": bool(conversation_context),
+                        "page_image_used": cached_answer["page_image_used"],
+                        "textbook_grade": grade,
+                        "is_followup": False,
+                        "answer_cache_hit": True,
+                        "answer_cache_similarity": cache_similarity
+                    }
+                )
+                
+                return ChatBotResponse(
+                    success=True,
+                    session_id=session_id,
+                    user_message_id=user_message_id,
+                    bot_message_id=bot_message_id,
+                    question=question,
+                    answer=cached_answer["answer"],
+                    answer_type=cached_answer["answer_type"],
+                    context_used=bool(conversation_context),
+                    out_of_context=False,
+                    educational_image=cached_answer["educational_image"],
+                    reference_pages=cached_answer["reference_pages"],
+                    page_image_used=cached_answer["page_image_used"],
+                    conversation_length=len(conversation_history) + 2
+                )
+        
         # Step 4: Enhanced search with conversation context
         search_results = await enhanced_context_search(
             user_email, textbook_id, question, conversation_history, top_k=3
@@ -212,7 +267,8 @@ async def ask_question_chatbot(
         print("✅ Question is relevant to textbook content")
         
         # Step 7: Get textbook metadata for grade-appropriate responses
-        textbook_info = await get_textbook_metadata(user_email, textbook_id)
+        if textbook_info is None:
+            textbook_info = await get_textbook_metadata(user_email, textbook_id)
         grade = textbook_info.get("grade", "1") if textbook_info else "1"
         
         # Step 8: Extract page image if available
@@ -279,6 +335,18 @@ async def ask_question_chatbot(
         )
         
         print(f"💾 Saved bot response: {bot_message_id}")
+        
+        # Cache answers to standalone questions for near-duplicate questions on this textbook;
+        # answers (and retrieval) shaped by this session's conversation are not reused elsewhere
+        if cache_embedding is not None and not conversation_context and answer_type != "contextual_followup":
+            answer_cache.store((user_email, textbook_id), grade, textbook_version, cache_embedding, cache_question_key, {
+                "answer": bot_response,
+                "answer_type": answer_type,
+                "educational_image": educational_image,
+                "reference_pages": sorted(list(page_numbers)),
+                "page_image_used": bool(page_image_base64)
+            })
+        
         print("🎉 Chatbot response completed successfully")
         
         return ChatBotResponse(
@@ -388,6 +456,27 @@ async def get_conversation_history(
             session_info=None
         )
 
+@router.get("/library/search", response_model=LibrarySearchResponse)
+async def search_user_library_endpoint(
+    request: Request,
+    query: str,
+    subject: Optional[str] = None,
+    top_k: int = Query(5, ge=1, le=50),
+    token: str = Depends(security)
+):
+    """Search across all of the user's textbooks (optionally one subject) in one query"""
+    user_email = request.state.current_user_email
+    
+    results = await asearch_user_library(user_email, query, top_k=top_k, subject=subject)
+    
+    return LibrarySearchResponse(
+        success=True,
+        query=query,
+        subject=subject,
+        results=results,
+        total=len(results)
+    )
+
 @router.get("/sessions", response_model=ChatSessionListResponse)
 async def list_user_chat_sessions(
     request: Request,
@@ -532,38 +621,30 @@ def is_followup_question(question: str, conversation_context: str) -> bool:
     return is_followup
 
 async def enhanced_context_search(user_email: str, textbook_id: str, question: str, conversation_history: list, top_k: int = 3):
-    """Enhanced search that considers conversation context for follow-up questions"""
-    
-    # First try regular search
-    regular_results = search_similar_chunks(user_email, textbook_id, question, top_k=top_k)
+    """Hybrid (vector + BM25) search that considers conversation context for follow-up questions"""
     
-    print(f"🔍 Regular search results: {len(regular_results)} chunks found")
-    if regular_results:
-        print(f"🎯 Regular search scores: {[round(score, 3) for _, score in regular_results]}")
-    
-    # If it's a follow-up question and regular search yields poor results, enhance with context
     conversation_context = build_conversation_context(conversation_history)
     
+    # Follow-ups often only make sense with earlier topics: the context-enhanced query
+    # joins the lexical pass and is searched in the same batched vector pass
+    lexical_query = question
+    extra_queries = []
     if is_followup_question(question, conversation_context):
-        
-        if not regular_results or (regular_results and max([score for _, score in regular_results]) < 0.4):
-            print("🔍 Regular search insufficient for follow-up question, enhancing with context...")
-            
-            # Extract keywords from conversation history
-            enhanced_query = extract_context_keywords(conversation_history, question)
-            
-            # Search again with enhanced query
-            context_results = search_similar_chunks(user_email, textbook_id, enhanced_query, top_k=top_k)
-            
-            if context_results:
-                print(f"✅ Context-enhanced search found {len(context_results)} results")
-                print(f"🎯 Enhanced search scores: {[round(score, 3) for _, score in context_results]}")
-                
-                # Use enhanced results if they're significantly better
-                if max([score for _, score in context_results]) > max([score for _, score in regular_results]) * 1.2:
-                    return context_results
+        lexical_query = extract_context_keywords(conversation_history, question)
+        if lexical_query != question:
+            extra_queries.append(lexical_query)
+    
+    # One (batched) vector pass + one lexical pass, fused by reciprocal rank (runs off the event loop)
+    results = await ahybrid_search_chunks(
+        user_email, textbook_id, question, top_k=top_k,
+        lexical_query=lexical_query, extra_queries=extra_queries
+    )
     
-    return regular_results
+    print(f"🔍 Hybrid search results: {len(results)} chunks found")
+    if results:
+        print(f"🎯 Search scores: {[round(score, 3) for _, score in results]}")
+    
+    return results
 
 def enhanced_relevance_check(question: str, textbook_context: str, similarity_scores: list, conversation_context: str) -> tuple[bool, str]:
     """Enhanced relevance check that considers conversation context"""
@@ -1014,6 +1095,7 @@ def extract_page_as_base64(pdf_path: str, page_number: int) -> Optional[str]:
         if not pdf_path or not os.path.exists(pdf_path):
             return None
             
+        fitz = get_fitz()
         pdf_document = fitz.open(pdf_path)
         
         if page_number <= len(pdf_document):
@@ -1091,5 +1173,11 @@ async def chatbot_health_check():
             "openai_configured": bool(os.getenv("OPENAI_API_KEY")),
             "huggingface_configured": bool(os.getenv("HUGGINGFACE_API_TOKEN")),
             "database_connected": True
-        }
+        },
+        "caches": {
+            "textbook_vectors": get_vector_cache_stats(),
+            "query_embeddings": get_query_cache_stats(),
+            "answers": answer_cache.stats()
+        },
+        "query_encoder": get_query_batcher_stats()
     }
@@ -2,7 +2,7 @@ from fastapi import APIRouter, UploadFile, File, Form, Request, HTTPException, D
 from fastapi.security import HTTPBearer
 from app.models.textbook_model import create_textbook_metadata, update_textbook_processing_status
 from app.models.chunk_model import create_textbook_chunks
-from app.utils.pdf_processor import extract_text_hybrid, chunk_text_smart, get_text_preview
+from app.utils.pdf_processor import extract_pdf, get_text_preview
 from typing import Optional
 import os
 import uuid
@@ -16,6 +16,9 @@ from app.utils.textbook_validator import validate_textbook
 router = APIRouter(prefix="/textbooks", tags=["textbooks"])
 security = HTTPBearer()
 
+# Uploads are written to disk in blocks of this size instead of being read into memory whole
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
 @router.post("/upload")
 async def upload_textbook(
     request: Request,
@@ -52,20 +55,20 @@ async def upload_textbook(
     file_path = os.path.join(upload_dir, unique_filename)
     
     try:
-        # Read and save file
-        content = await textbook.read()
-        file_size = len(content)
-        
         # Save file to disk
+        file_size = 0
         with open(file_path, "wb") as buffer:
-            buffer.write(content)
+            while block := await textbook.read(UPLOAD_BLOCK_SIZE):
+                buffer.write(block)
+                file_size += len(block)
         
         print(f"File saved: {file_path} ({file_size} bytes)")
         
-        # Extract text from PDF
+        # Extract and chunk text page by page from the saved file
         print("Extracting text from PDF...")
-        extraction_result = extract_text_hybrid(content)
-        extracted_text = extraction_result["combined_text"]
+        extraction_result = extract_pdf(file_path, chunk_size=800)
+        chunks = extraction_result["chunks"]
+        extracted_text = "\n\n".join(chunk["content"] for chunk in chunks)
 
         validation = validate_textbook(extracted_text, subject, grade)
     
@@ -81,10 +84,6 @@ async def upload_textbook(
         
         print(f"Extracted {len(extracted_text)} characters of text")
         
-        # Split text into chunks (NO FULL TEXT STORAGE)
-        print("Creating text chunks...")
-        chunks = chunk_text_smart(extracted_text, chunk_size=800, overlap=100)
-        
         if not chunks:
             raise HTTPException(status_code=400, detail="Failed to create text chunks")
         
@@ -123,28 +122,22 @@ async def upload_textbook(
         # Get preview from chunks
         text_preview = get_text_preview(chunks)
 
-        # Save chunks to database
-        chunk_ids = await create_textbook_chunks(
-            textbook_id=textbook_id,
-            user_email=user_email, 
-            chunks=chunks,
-            textbook_metadata=textbook_metadata
-        )
-        print(f"Saved {len(chunk_ids)} chunks to database")
-
         # NEW: Create vector embeddings and FAISS index
         print("Creating vector embeddings...")
         try:
-            index_path, chunks_path = process_chunks_to_vectors(
+            index_path, chunks_path, embedding_stats = process_chunks_to_vectors(
                 user_email=user_email,
                 textbook_id=textbook_id, 
-                chunks=chunks
+                chunks=chunks,
+                subject=subject,
+                chunk_ids=chunk_ids
             )
             print(f"Vectors created successfully: {index_path}")
             vector_created = True
         except Exception as e:
             print(f"Vector creation failed: {e}")
             vector_created = False
+            embedding_stats = None
 
         
         result = {
@@ -162,6 +155,9 @@ async def upload_textbook(
                 "chunk_count": len(chunks),
                 "total_words": total_words,
                 "vectors_created": vector_created,  # NEW
+                "embedding_cache": embedding_stats,
+                "page_count": extraction_result["page_count"],
+                "ocr_pages": extraction_result["ocr_pages"],
                 "text_preview": text_preview,
                 "processing_status": "completed"
             }
@@ -79,3 +79,20 @@ class ChatSessionListResponse(BaseModel):
     success: bool
     sessions: List[ChatSessionResponse]
     total: int
+
+
+class LibrarySearchResult(BaseModel):
+    textbook_id: str
+    subject: Optional[str] = None
+    page_number: int
+    chunk_number: int
+    content: str
+    score: float
+
+
+class LibrarySearchResponse(BaseModel):
+    success: bool
+    query: str
+    subject: Optional[str] = None
+    results: List[LibrarySearchResult]
+    total: int
@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from app.utils.lru_cache import LRUCache
+
+# Semantic cache of final chatbot answers.
+#
+# Whole classes ask the same textbook the same questions within minutes. A
+# standalone question whose embedding is within ANSWER_CACHE_SIMILARITY (cosine)
+# of a recently answered one, for the same textbook and grade, is served the
+# cached answer without the relevance check and answer generation LLM calls.
+#
+# Embeddings barely separate "what is 3/4" from "what is 3*4", so a question with
+# digits or operators is only served an answer cached for the same normalized text.
+#
+# Each (textbook, grade) bucket records the textbook's version (its vector files'
+# signature) and is dropped when the textbook is re-indexed or updated, also when
+# that happens in another worker process.
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+ANSWER_CACHE_MAX_PER_TEXTBOOK = int(os.getenv("ANSWER_CACHE_MAX_PER_TEXTBOOK", "256"))
+ANSWER_CACHE_MAX_TEXTBOOKS = int(os.getenv("ANSWER_CACHE_MAX_TEXTBOOKS", "1024"))
+
+_EXACT_MATCH_RE = re.compile(r"[\d+\-*/=<>^()%]")
+
+
+def needs_exact_match(question_key: str) -> bool:
+    """Questions with digits or operators differ in ways embeddings do not capture"""
+    return bool(_EXACT_MATCH_RE.search(question_key))
+
+
+class _AnswerBucket:
+    """Cached answers for one (textbook, grade), least recently used first"""
+
+    def __init__(self, version: Hashable):
+        self.version = version
+        self.entries = OrderedDict()  # entry id -> (embedding, answer, created_at, question key)
+        self.next_id = 0
+
+
+class SemanticAnswerCache:
+    """Answers keyed by question embedding, per textbook and grade, with TTL and LRU eviction"""
+
+    def __init__(
+        self,
+        min_similarity: float = ANSWER_CACHE_SIMILARITY,
+        ttl_seconds: float = ANSWER_CACHE_TTL_S,
+        max_entries_per_textbook: int = ANSWER_CACHE_MAX_PER_TEXTBOOK,
+        max_textbooks: int = ANSWER_CACHE_MAX_TEXTBOOKS
+    ):
+        self.min_similarity = min_similarity
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_textbook = max_entries_per_textbook
+        self._buckets = LRUCache(max_entries=max_textbooks)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def _bucket(self, textbook_key: Tuple[str, str], grade: str, version: Hashable, create: bool = False) -> Optional[_AnswerBucket]:
+        key = textbook_key + (str(grade),)
+        bucket = self._buckets.get(key)
+        if bucket is not None and bucket.version != version:
+            # Textbook re-indexed or updated since these answers were generated
+            self._buckets.invalidate(key)
+            bucket = None
+        if bucket is None and create:
+            bucket = _AnswerBucket(version)
+            self._buckets.put(key, bucket)
+        return bucket
+
+    def lookup(self, textbook_key: Tuple[str, str], grade: str, version: Hashable, query_embedding: np.ndarray, question_key: str) -> Optional[Tuple[Any, float]]:
+        """(answer, similarity) of the most similar live cached question, or None
+        
+        question_key is the normalized question text (see normalize_query).
+        """
+        with self._lock:
+            bucket = self._bucket(textbook_key, grade, version)
+            if bucket is not None:
+                expired = [entry_id for entry_id, (_, _, created_at, _) in bucket.entries.items()
+                           if time.time() - created_at > self.ttl_seconds]
+                for entry_id in expired:
+                    del bucket.entries[entry_id]
+                self.expirations += len(expired)
+
+            if not bucket or not bucket.entries:
+                self.misses += 1
+                return None
+
+            entry_ids = list(bucket.entries)
+            if needs_exact_match(question_key):
+                entry_ids = [entry_id for entry_id in entry_ids if bucket.entries[entry_id][3] == question_key]
+                if not entry_ids:
+                    self.misses += 1
+                    return None
+            embeddings = np.vstack([bucket.entries[entry_id][0] for entry_id in entry_ids])
+            similarities = embeddings @ np.asarray(query_embedding, dtype='float32').reshape(-1)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.min_similarity:
+                self.misses += 1
+                return None
+
+            bucket.entries.move_to_end(entry_ids[best])
+            self.hits += 1
+            return bucket.entries[entry_ids[best]][1], float(similarities[best])
+
+    def store(self, textbook_key: Tuple[str, str], grade: str, version: Hashable, query_embedding: np.ndarray, question_key: str, answer: Any):
+        """Cache an answer under a (normalized) question embedding and normalized question text"""
+        with self._lock:
+            bucket = self._bucket(textbook_key, grade, version, create=True)
+            bucket.entries[bucket.next_id] = (
+                np.asarray(query_embedding, dtype='float32').reshape(-1).copy(), answer, time.time(), question_key
+            )
+            bucket.next_id += 1
+            self.stores += 1
+
+            while len(bucket.entries) > self.max_entries_per_textbook:
+                bucket.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_textbook(self, textbook_key: Tuple[str, str]) -> int:
+        """Drop every grade's answers for a textbook; returns number of buckets dropped"""
+        with self._lock:
+            return self._buckets.invalidate_where(lambda key: key[:2] == textbook_key)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "textbook_evictions": self._buckets.evictions,
+                "textbook_invalidations": self._buckets.invalidations,
+                "textbooks": len(self._buckets),
+                "min_similarity": self.min_similarity,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,106 @@
+import mmap
+import os
+import struct
+import numpy as np
+from typing import List, Optional, Sequence
+
+# Columnar on-disk chunk store, read through mmap.
+#
+# Layout (little endian):
+#   header          MAGIC (8 bytes) | version uint32 | count uint32
+#   offsets         uint64[count + 1]   byte offsets of each chunk inside the blob
+#   page_numbers    int32[count]
+#   chunk_numbers   int32[count]
+#   blob            UTF-8 chunk texts, concatenated
+#
+# Opening a store maps the file read-only; the typed arrays are zero-copy views
+# over the mapping and a lookup only touches the rows it reads, so worker
+# processes share the OS page cache instead of each unpickling every chunk.
+
+MAGIC = b"ECCHUNK1"
+VERSION = 1
+_HEADER = struct.Struct("<8sII")
+
+
+def write_chunk_store(
+    path: str,
+    texts: Sequence[str],
+    page_numbers: Optional[Sequence[int]] = None,
+    chunk_numbers: Optional[Sequence[int]] = None
+):
+    """Write chunk texts and their page/chunk numbers to path (atomically replaced)"""
+    count = len(texts)
+    if page_numbers is None:
+        page_numbers = [0] * count
+    if chunk_numbers is None:
+        chunk_numbers = range(1, count + 1)
+
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(count + 1, dtype="<u8")
+    if count:
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, count))
+        f.write(offsets.tobytes())
+        f.write(np.asarray(page_numbers, dtype="<i4").tobytes())
+        f.write(np.asarray(chunk_numbers, dtype="<i4").tobytes())
+        for item in encoded:
+            f.write(item)
+    os.replace(tmp_path, path)
+
+
+class ChunkStore:
+    """Read-only, memory-mapped view of a chunk store file (indexable like a list of str)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"Not a chunk store (or unsupported version): {path}")
+
+        self.count = count
+        position = _HEADER.size
+        self.offsets = np.frombuffer(self._mm, dtype="<u8", count=count + 1, offset=position)
+        position += self.offsets.nbytes
+        self.page_numbers = np.frombuffer(self._mm, dtype="<i4", count=count, offset=position)
+        position += self.page_numbers.nbytes
+        self.chunk_numbers = np.frombuffer(self._mm, dtype="<i4", count=count, offset=position)
+        position += self.chunk_numbers.nbytes
+        self._blob_start = position
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        start = self._blob_start + int(self.offsets[i])
+        end = self._blob_start + int(self.offsets[i + 1])
+        return self._mm[start:end].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def get_many(self, ids: Sequence[int]) -> List[str]:
+        """Texts for several rows"""
+        return [self[int(i)] for i in ids]
+
+    def page_number(self, i: int) -> int:
+        return int(self.page_numbers[i])
+
+    def chunk_number(self, i: int) -> int:
+        return int(self.chunk_numbers[i])
+
+    def close(self):
+        # Array views keep the buffer exported; drop them before closing the mapping
+        self.offsets = self.page_numbers = self.chunk_numbers = None
+        self._mm.close()
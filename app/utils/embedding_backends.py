@@ -0,0 +1,180 @@
+import os
+import re
+import numpy as np
+from typing import List
+
+# Pluggable text-embedding backends. Every backend mirrors the small part of the
+# SentenceTransformer API the app uses (encode / get_sentence_embedding_dimension)
+# and produces vectors compatible with the PyTorch model, so indexes and caches
+# built with one backend can be searched with another.
+#
+# EMBEDDING_BACKEND selects one of:
+#   torch      SentenceTransformer on PyTorch (default)
+#   onnx       same model exported to ONNX, run with ONNX Runtime
+#   onnx-int8  the ONNX export with dynamically int8-quantized weights
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_MAX_LENGTH = int(os.getenv("EMBEDDING_MAX_LENGTH", "256"))  # all-MiniLM-L6-v2 max_seq_length
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "data/onnx")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 = ONNX Runtime default
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def hf_model_id(model_name: str) -> str:
+    """Hugging Face repo id for a sentence-transformers model name"""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def embedding_cache_key(model_name: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND) -> str:
+    """Name under which a backend's embeddings may be cached
+
+    fp32 ONNX reproduces the PyTorch vectors to float precision and shares their
+    cache; int8 vectors differ slightly and are kept apart.
+    """
+    return f"{model_name}@int8" if backend == "onnx-int8" else model_name
+
+
+class SentenceTransformerBackend:
+    """SentenceTransformer on PyTorch"""
+
+    name = "torch"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        return np.asarray(
+            self.model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar),
+            dtype='float32'
+        )
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+
+class OnnxEmbeddingBackend:
+    """The same transformer run with ONNX Runtime: mean pooling + L2 normalization like all-MiniLM-L6-v2"""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, quantized: bool = False):
+        try:
+            import onnxruntime
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND=onnx requires onnxruntime and transformers") from e
+
+        self.model_name = model_name
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.tokenizer = AutoTokenizer.from_pretrained(hf_model_id(model_name))
+
+        model_path = get_onnx_model_path(model_name, quantized)
+        options = onnxruntime.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self._dimension = None
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=EMBEDDING_MAX_LENGTH, return_tensors="np"
+        )
+        feeds = {name: tokens[name].astype('int64') for name in self.input_names if name in tokens}
+        hidden = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens
+        mask = tokens["attention_mask"][..., None].astype('float32')
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype('float32')
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype='float32')
+
+        # Batch texts of similar length together to minimize padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            if show_progress_bar:
+                print(f"Encoding {start + len(batch)}/{len(texts)}...")
+            for i, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                embeddings[i] = vector
+
+        return np.stack(embeddings)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = int(self._encode_batch(["dimension probe"]).shape[1])
+        return self._dimension
+
+
+def get_onnx_model_path(model_name: str, quantized: bool = False) -> str:
+    """Path of the ONNX export (exported / quantized on first use)"""
+    model_dir = os.path.join(ONNX_MODEL_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+
+    if not os.path.exists(fp32_path):
+        export_onnx_model(model_name, fp32_path)
+
+    if not quantized:
+        return fp32_path
+
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        print(f"Quantizing {fp32_path} to int8...")
+        quantize_dynamic(fp32_path, f"{int8_path}.tmp", weight_type=QuantType.QInt8)
+        os.replace(f"{int8_path}.tmp", int8_path)
+
+    return int8_path
+
+
+def export_onnx_model(model_name: str, path: str):
+    """Export the model's transformer (token embeddings) to ONNX with dynamic batch/sequence axes"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    print(f"Exporting {model_name} to ONNX...")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(hf_model_id(model_name))
+    model = AutoModel.from_pretrained(hf_model_id(model_name))
+    model.config.return_dict = False
+    model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            f"{path}.tmp",
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    os.replace(f"{path}.tmp", path)
+    print(f"ONNX model saved: {path}")
+
+
+def create_embedding_backend(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL_NAME):
+    """Instantiate an embedding backend by name"""
+    if backend == "torch":
+        return SentenceTransformerBackend(model_name)
+    if backend == "onnx":
+        return OnnxEmbeddingBackend(model_name)
+    if backend == "onnx-int8":
+        return OnnxEmbeddingBackend(model_name, quantized=True)
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {EMBEDDING_BACKENDS})")
@@ -0,0 +1,327 @@
+import argparse
+import os
+import threading
+import time
+import numpy as np
+from collections import deque
+from multiprocessing.connection import Client, Listener
+from typing import Callable, List, Optional
+
+from app.utils.embedding_backends import (
+    create_embedding_backend, embedding_cache_key, EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME
+)
+
+# Shared embedding server: one process owns the embedding model and serves encode
+# requests from every uvicorn worker over a local Unix socket, instead of each
+# worker loading its own copy of the weights and its own torch thread pool.
+#
+# Small (query) requests from all connections are coalesced into batched model
+# calls and always run before bulk (upload) requests, which clients split into
+# pieces of at most EMBEDDING_SERVER_MAX_REQUEST_TEXTS texts, so a large upload
+# cannot hold up interactive queries for long.
+#
+# Messages are pickled by multiprocessing.connection; the socket is only
+# accessible to its owner and connections must authenticate with a shared key:
+# EMBEDDING_SERVER_AUTHKEY if set, otherwise a random key the server generates
+# at start and writes to "<socket>.key" (mode 0600), where clients read it.
+#
+# Start it with:
+#     python -m app.utils.embedding_server --socket /tmp/educhat-embeddings.sock
+# and set EMBEDDING_SERVER_SOCKET to the same path for the API workers.
+
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET", "")  # empty = encode in-process
+EMBEDDING_SERVER_AUTHKEY = os.getenv("EMBEDDING_SERVER_AUTHKEY", "").encode()  # empty = random per server start
+EMBEDDING_SERVER_TIMEOUT_S = float(os.getenv("EMBEDDING_SERVER_TIMEOUT_S", "60"))
+EMBEDDING_SERVER_MAX_REQUEST_TEXTS = int(os.getenv("EMBEDDING_SERVER_MAX_REQUEST_TEXTS", "256"))
+# After a failed request, encode in-process for this long before retrying the server
+EMBEDDING_SERVER_RETRY_S = float(os.getenv("EMBEDDING_SERVER_RETRY_S", "30"))
+
+
+class EmbeddingServerError(RuntimeError):
+    """The embedding server could not serve a request"""
+
+
+def authkey_path(address: str) -> str:
+    """File the server writes its generated authentication key to"""
+    return f"{address}.key"
+
+
+def load_authkey(address: str) -> bytes:
+    """The configured key, or the one the server at address generated"""
+    if EMBEDDING_SERVER_AUTHKEY:
+        return EMBEDDING_SERVER_AUTHKEY
+    with open(authkey_path(address), "rb") as f:
+        return f.read()
+
+
+def _write_authkey(address: str, authkey: bytes):
+    path = authkey_path(address)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    os.replace(tmp_path, path)
+
+
+class EmbeddingServer:
+    """Serves encode requests for one embedding backend over a Unix socket"""
+
+    def __init__(self, backend, address: str, authkey: Optional[bytes] = None,
+                 max_batch_texts: int = 256, max_wait_ms: float = 5.0, max_interactive_texts: int = 32):
+        self.backend = backend
+        self.address = address
+        self.authkey = authkey or EMBEDDING_SERVER_AUTHKEY or None
+        self.max_batch_texts = max_batch_texts
+        self.max_wait = max_wait_ms / 1000.0
+        # Requests with at most this many texts (single queries, micro-batches) go first
+        self.max_interactive_texts = max_interactive_texts
+        self.info = {
+            "model": backend.model_name,
+            "backend": backend.name,
+            "dimension": backend.get_sentence_embedding_dimension()
+        }
+        # (connection, texts, batch_size), oldest first
+        self._interactive = deque()
+        self._bulk = deque()
+        self._condition = threading.Condition()
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)  # stale socket from a previous run
+
+        if self.authkey is None:
+            self.authkey = os.urandom(32)
+            _write_authkey(self.address, self.authkey)
+
+        listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        os.chmod(self.address, 0o600)
+        threading.Thread(target=self._encode_loop, daemon=True, name="encode").start()
+        print(f"Embedding server ({self.info['model']}, {self.info['backend']}) listening on {self.address}")
+
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:
+                    # Failed authentication or a client that went away mid-handshake
+                    print(f"Rejected embedding client: {e}")
+                    continue
+                threading.Thread(target=self._read_loop, args=(connection,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def _read_loop(self, connection):
+        """Read requests from one client; replies are sent by the encode loop"""
+        try:
+            while True:
+                op, payload = connection.recv()
+                if op == "info":
+                    connection.send(("ok", self.info))
+                elif op == "encode":
+                    texts, batch_size = payload
+                    self._enqueue((connection, list(texts), batch_size))
+                else:
+                    connection.send(("error", f"unknown op: {op}"))
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+
+    def _enqueue(self, request: tuple):
+        with self._condition:
+            if len(request[1]) <= self.max_interactive_texts:
+                self._interactive.append(request)
+            else:
+                self._bulk.append(request)
+            self._condition.notify()
+
+    def _collect_batch(self) -> list:
+        """Next requests to encode together: waiting small requests coalesced, else one bulk request"""
+        with self._condition:
+            while not self._interactive and not self._bulk:
+                self._condition.wait()
+            if not self._interactive:
+                return [self._bulk.popleft()]
+
+            batch = [self._interactive.popleft()]
+            texts = len(batch[0][1])
+            deadline = time.monotonic() + self.max_wait
+            while texts < self.max_batch_texts:
+                if self._interactive:
+                    request = self._interactive.popleft()
+                    batch.append(request)
+                    texts += len(request[1])
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return batch
+
+    def _encode_loop(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for _, request_texts, _ in batch for text in request_texts]
+            batch_size = max(request_batch_size for _, _, request_batch_size in batch)
+
+            try:
+                embeddings = self.backend.encode(texts, batch_size=batch_size)
+                replies, start = [], 0
+                for _, request_texts, _ in batch:
+                    replies.append(("ok", embeddings[start:start + len(request_texts)]))
+                    start += len(request_texts)
+            except Exception as e:
+                print(f"Embedding server encode failed: {e}")
+                replies = [("error", str(e))] * len(batch)
+
+            for (connection, _, _), reply in zip(batch, replies):
+                try:
+                    connection.send(reply)
+                except (OSError, ValueError):
+                    pass  # client disconnected
+
+
+class EmbeddingClient:
+    """Thread-safe client of an EmbeddingServer (one pooled connection per concurrent caller)"""
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None,
+                 timeout: float = EMBEDDING_SERVER_TIMEOUT_S,
+                 max_request_texts: int = EMBEDDING_SERVER_MAX_REQUEST_TEXTS):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.max_request_texts = max_request_texts
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _request(self, op: str, payload=None):
+        with self._lock:
+            connection = self._connections.pop() if self._connections else None
+        if connection is None:
+            # Read the key per connection: a restarted server generates a new one
+            connection = Client(self.address, family="AF_UNIX", authkey=self.authkey or load_authkey(self.address))
+
+        try:
+            connection.send((op, payload))
+            if not connection.poll(self.timeout):
+                raise EmbeddingServerError(f"no reply from embedding server within {self.timeout}s")
+            status, result = connection.recv()
+        except Exception:
+            connection.close()
+            raise
+
+        with self._lock:
+            self._connections.append(connection)
+
+        if status != "ok":
+            raise EmbeddingServerError(result)
+        return result
+
+    def info(self) -> dict:
+        return self._request("info")
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        texts = list(texts)
+        if len(texts) <= self.max_request_texts:
+            return np.asarray(self._request("encode", (texts, batch_size)), dtype='float32')
+
+        # One request per piece: other workers' queries are served between them
+        return np.vstack([
+            np.asarray(self._request("encode", (texts[start:start + self.max_request_texts], batch_size)), dtype='float32')
+            for start in range(0, len(texts), self.max_request_texts)
+        ])
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+
+class RemoteEmbeddingBackend:
+    """Embedding backend that encodes on the shared server, falling back to an in-process backend
+
+    The fallback is only loaded when the server is unavailable; while it is in use
+    the server is retried every EMBEDDING_SERVER_RETRY_S seconds.
+    """
+
+    name = "remote"
+
+    def __init__(self, address: str, fallback_factory: Callable,
+                 model_name: str = EMBEDDING_MODEL_NAME, backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        self.client = EmbeddingClient(address)
+        self.fallback_factory = fallback_factory
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        self._retry_at = 0.0
+        self._checked = False
+        self._dimension = None
+
+    def _server_available(self) -> bool:
+        if time.monotonic() < self._retry_at:
+            return False
+        if not self._checked:
+            # Vectors from another model (or precision) would not match the saved indexes and cache
+            info = self.client.info()
+            expected = embedding_cache_key(self.model_name, self.backend)
+            if embedding_cache_key(info["model"], info["backend"]) != expected:
+                raise EmbeddingServerError(
+                    f"embedding server serves {info['model']} ({info['backend']}), expected {expected}"
+                )
+            self._dimension = info["dimension"]
+            self._checked = True
+        return True
+
+    def _get_fallback(self):
+        with self._fallback_lock:
+            if self._fallback is None:
+                print("Loading in-process embedding model as fallback...")
+                self._fallback = self.fallback_factory()
+            return self._fallback
+
+    def _server_failed(self, error: Exception):
+        print(f"Embedding server unavailable ({error}), encoding in-process for {EMBEDDING_SERVER_RETRY_S:g}s")
+        self._retry_at = time.monotonic() + EMBEDDING_SERVER_RETRY_S
+        self._checked = False
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        try:
+            if self._server_available():
+                return self.client.encode(texts, batch_size=batch_size)
+        except Exception as e:
+            self._server_failed(e)
+        return self._get_fallback().encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        try:
+            if self._server_available():
+                return self._dimension
+        except Exception as e:
+            self._server_failed(e)
+        return self._get_fallback().get_sentence_embedding_dimension()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Shared embedding server for all API workers")
+    parser.add_argument("--socket", default=EMBEDDING_SERVER_SOCKET or "/tmp/educhat-embeddings.sock")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--max-batch-texts", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-interactive-texts", type=int, default=32, help="requests up to this size run before bulk ones")
+    args = parser.parse_args(argv)
+
+    backend = create_embedding_backend(args.backend, args.model)
+    EmbeddingServer(
+        backend, args.socket,
+        max_batch_texts=args.max_batch_texts, max_wait_ms=args.max_wait_ms,
+        max_interactive_texts=args.max_interactive_texts
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
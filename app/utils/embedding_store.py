@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import fcntl  # cross-process append lock (POSIX only)
+except ImportError:
+    fcntl = None
+
+# Persistent chunk-embedding cache keyed by model name + SHA-256 of the chunk text.
+#
+# One directory per model holding:
+#   meta.json     {"model": ..., "dimension": ...}
+#   vectors.f16   float16 rows, appended
+#   hashes.bin    32-byte SHA-256 digests, appended; row i belongs to vector row i
+#
+# Vectors are written before their digests, so a digest is only ever visible once
+# its row is complete. Other processes' appends are picked up on the next lookup.
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+DIGEST_SIZE = 32
+
+
+def text_digest(text: str) -> bytes:
+    """SHA-256 digest of a chunk's text"""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """Append-only, content-addressed store of fp16 embeddings for one model"""
+
+    def __init__(self, model_name: str, root: str = EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        self.dir = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.vectors_path = os.path.join(self.dir, "vectors.f16")
+        self.hashes_path = os.path.join(self.dir, "hashes.bin")
+        self.lock_path = os.path.join(self.dir, ".lock")
+
+        self.dimension = None
+        self._rows = {}  # digest -> row
+        self._row_count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._row_count
+
+    def _load_meta(self) -> bool:
+        if self.dimension is None and os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.dimension = json.load(f)["dimension"]
+        return self.dimension is not None
+
+    def _refresh(self):
+        """Index digests appended since the last refresh (by this or another process)"""
+        if not self._load_meta() or not os.path.exists(self.hashes_path):
+            return
+
+        hashes_size = os.path.getsize(self.hashes_path)
+        complete_rows = min(
+            hashes_size // DIGEST_SIZE,
+            os.path.getsize(self.vectors_path) // (2 * self.dimension)
+        )
+        if complete_rows <= self._row_count:
+            return
+
+        with open(self.hashes_path, "rb") as f:
+            f.seek(self._row_count * DIGEST_SIZE)
+            data = f.read((complete_rows - self._row_count) * DIGEST_SIZE)
+
+        for i in range(len(data) // DIGEST_SIZE):
+            self._rows.setdefault(data[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE], self._row_count + i)
+        self._row_count = complete_rows
+
+    def get_many(self, digests: Sequence[bytes]) -> Dict[int, np.ndarray]:
+        """float32 vectors for the digests that are cached, keyed by position in digests"""
+        with self._lock:
+            self._refresh()
+            positions = {i: self._rows[d] for i, d in enumerate(digests) if d in self._rows}
+            if not positions:
+                return {}
+            vectors = np.memmap(self.vectors_path, dtype="<f2", mode="r", shape=(self._row_count, self.dimension))
+            return {i: np.asarray(vectors[row], dtype="float32") for i, row in positions.items()}
+
+    def put_many(self, digests: Sequence[bytes], vectors: np.ndarray) -> int:
+        """Append vectors for digests not cached yet; returns number appended"""
+        if len(digests) == 0:
+            return 0
+
+        with self._lock:
+            os.makedirs(self.dir, exist_ok=True)
+            with open(self.lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    if not self._load_meta():
+                        self.dimension = int(vectors.shape[1])
+                        with open(self.meta_path, "w") as f:
+                            json.dump({"model": self.model_name, "dimension": self.dimension}, f)
+                    elif vectors.shape[1] != self.dimension:
+                        print(f"Embedding cache dimension mismatch ({vectors.shape[1]} != {self.dimension}), not caching")
+                        return 0
+
+                    self._refresh()
+                    new_rows = []
+                    seen = set()
+                    for i, digest in enumerate(digests):
+                        if digest not in self._rows and digest not in seen:
+                            seen.add(digest)
+                            new_rows.append(i)
+                    if not new_rows:
+                        return 0
+
+                    new_digests = [digests[i] for i in new_rows]
+                    new_vectors = np.ascontiguousarray(vectors[new_rows], dtype="<f2")
+
+                    # Drop a partially written tail left by a crashed writer
+                    complete_rows = self._row_count
+                    with open(self.vectors_path, "ab") as f:
+                        f.truncate(complete_rows * 2 * self.dimension)
+                        f.write(new_vectors.tobytes())
+                    with open(self.hashes_path, "ab") as f:
+                        f.truncate(complete_rows * DIGEST_SIZE)
+                        f.write(b"".join(new_digests))
+
+                    for offset, digest in enumerate(new_digests):
+                        self._rows[digest] = complete_rows + offset
+                    self._row_count = complete_rows + len(new_digests)
+                    return len(new_digests)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def split_cached(store: Optional[EmbeddingStore], texts: List[str]):
+    """Look texts up in store; returns (digests, {position: vector}, {digest: first miss position})"""
+    digests = [text_digest(text) for text in texts]
+    found = store.get_many(digests) if store is not None else {}
+
+    misses = {}
+    for i, digest in enumerate(digests):
+        if i not in found and digest not in misses:
+            misses[digest] = i
+
+    return digests, found, misses
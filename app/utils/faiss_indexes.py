@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import numpy as np
+import math
+import os
+from typing import TYPE_CHECKING, Optional
+from app.utils.lazy_imports import get_faiss
+
+if TYPE_CHECKING:
+    import faiss
+
+# Textbooks with at least this many vectors get an approximate (ANN) index
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "10000"))
+# ANN family used above the threshold: "hnsw" or "ivf"
+ANN_INDEX_TYPE = os.getenv("ANN_INDEX_TYPE", "hnsw")
+
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+DEFAULT_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+DEFAULT_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+
+# Build-time recall check of ANN indexes against exact search
+ANN_MIN_RECALL = float(os.getenv("ANN_MIN_RECALL", "0.9"))
+ANN_RECALL_SAMPLE = int(os.getenv("ANN_RECALL_SAMPLE", "200"))
+ANN_RECALL_K = 10
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+
+# Vector compression: "none", "sq8" (1 byte/dim), "fp16" (2 bytes/dim) or "pq"
+# (product quantization, PQ_M bytes/vector); applied to textbooks with at least
+# COMPRESSION_MIN_VECTORS vectors
+INDEX_COMPRESSION = os.getenv("INDEX_COMPRESSION", "none")
+COMPRESSION_MIN_VECTORS = int(os.getenv("COMPRESSION_MIN_VECTORS", "0"))
+COMPRESSIONS = ("none", "sq8", "fp16", "pq")
+# Smallest to largest; a codec that misses ANN_MIN_RECALL is replaced by the next one
+_COMPRESSION_STEPS = ("pq", "sq8", "fp16", "none")
+PQ_M = int(os.getenv("PQ_M", "48"))
+PQ_MIN_TRAIN_VECTORS = 39 * 256
+
+# How saved indexes are loaded: "memory" (private heap copy per process) or
+# "mmap" (read-only mapping, worker processes share the OS page cache)
+INDEX_LOAD_MODE = os.getenv("INDEX_LOAD_MODE", "memory")
+INDEX_LOAD_MODES = ("memory", "mmap")
+
+
+def read_index(path: str, mode: Optional[str] = None) -> faiss.Index:
+    """Read a saved index in the given (or configured) load mode"""
+    faiss = get_faiss()
+    mode = mode or INDEX_LOAD_MODE
+    if mode not in INDEX_LOAD_MODES:
+        raise ValueError(f"Unknown index load mode: {mode}")
+
+    if mode == "memory":
+        return faiss.read_index(path)
+
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+    # Newer FAISS can also map flat codes in place; IVF inverted lists reject that
+    # reader and are mapped through the plain IO_FLAG_MMAP path instead
+    mmap_ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    if mmap_ifc:
+        try:
+            return faiss.read_index(path, flags | mmap_ifc)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path, flags)
+
+
+def resolve_index_type(vector_count: int, index_type: Optional[str] = None) -> str:
+    """Pick the index type for a textbook ("auto"/None selects by vector count)"""
+    if index_type and index_type != "auto":
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type}")
+        return index_type
+    return ANN_INDEX_TYPE if vector_count >= ANN_MIN_VECTORS else "flat"
+
+
+def ivf_nlist(vector_count: int) -> int:
+    """Number of IVF lists: ~4*sqrt(n), keeping >= 39 training points per list"""
+    return max(1, min(int(4 * math.sqrt(vector_count)), vector_count // 39))
+
+
+def resolve_compression(vector_count: int, compression: Optional[str] = None, index_type: Optional[str] = None) -> str:
+    """Pick vector compression for a textbook (None uses the deployment setting)
+
+    index_type is the resolved index type; pq is not available for hnsw.
+    """
+    compression = compression or INDEX_COMPRESSION
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown index compression: {compression}")
+    if compression != "none" and vector_count < COMPRESSION_MIN_VECTORS:
+        return "none"
+    if compression == "pq" and index_type == "hnsw":
+        print("pq compression is not supported with hnsw indexes, using sq8")
+        return "sq8"
+    if compression == "pq" and vector_count < PQ_MIN_TRAIN_VECTORS:
+        # Too few vectors to train 256 centroids per sub-quantizer
+        print(f"Only {vector_count} vectors, using sq8 instead of pq")
+        return "sq8"
+    return compression
+
+
+def compression_fallbacks(compression: str) -> tuple:
+    """compression followed by the larger, more accurate codecs to try if its recall is too low"""
+    return _COMPRESSION_STEPS[_COMPRESSION_STEPS.index(compression):]
+
+
+def pq_subquantizers(dimension: int) -> int:
+    """Largest PQ_M-or-smaller number of sub-quantizers that divides the dimension"""
+    m = min(PQ_M, dimension)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def index_factory_string(index_type: str, compression: str, dimension: int, vector_count: int) -> str:
+    """FAISS index_factory description for an index type + compression"""
+    codec = {
+        "none": "Flat",
+        "sq8": "SQ8",
+        "fp16": "SQfp16",
+        "pq": f"PQ{pq_subquantizers(dimension)}x8"
+    }[compression]
+
+    if index_type == "flat":
+        return codec
+    if index_type == "ivf":
+        return f"IVF{ivf_nlist(vector_count)},{codec}"
+    if index_type == "hnsw":
+        if compression == "pq":
+            raise ValueError("pq compression is not supported with hnsw indexes")
+        return f"HNSW{HNSW_M}" if compression == "none" else f"HNSW{HNSW_M},{codec}"
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def build_index(index_type: str, embeddings: np.ndarray, compression: str = "none") -> faiss.Index:
+    """Build an inner-product index of the given type/compression over normalized embeddings"""
+    faiss = get_faiss()
+    vector_count, dimension = embeddings.shape
+    description = index_factory_string(index_type, compression, dimension, vector_count)
+
+    index = faiss.index_factory(dimension, description, faiss.METRIC_INNER_PRODUCT)
+
+    if index_type == "hnsw":
+        hnsw = faiss.downcast_index(index).hnsw
+        hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        hnsw.efSearch = DEFAULT_EF_SEARCH
+    elif index_type == "ivf":
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(DEFAULT_NPROBE, ivf.nlist)
+
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+
+def _codec_name(index: faiss.Index) -> str:
+    """Codec of a flat-scan index: sq8, fp16, pq, or an empty string when uncompressed"""
+    faiss = get_faiss()
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    if isinstance(index, faiss.IndexPQ):
+        return "pq"
+    return ""
+
+
+def describe_index_type(index: faiss.Index) -> str:
+    """Short name of an index's structure ("flat", "ivf_flat", "hnsw_sq8", "pq", ...)"""
+    faiss = get_faiss()
+    index = faiss.downcast_index(index)
+
+    if isinstance(index, faiss.IndexHNSW):
+        codec = _codec_name(index.storage)
+        return f"hnsw_{codec}" if codec else "hnsw"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return "ivf_fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "ivf_sq8"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexFlat):
+        return "flat"
+    return _codec_name(index) or type(index).__name__
+
+
+def index_compression(index: faiss.Index) -> str:
+    """Compression of an index's stored vectors: none, sq8, fp16 or pq"""
+    codec = describe_index_type(index).rsplit("_", 1)[-1]
+    return codec if codec in COMPRESSIONS else "none"
+
+
+def index_size_bytes(index: faiss.Index) -> int:
+    """Serialized size of an index (what it costs on disk and, loaded, roughly in RAM)"""
+    faiss = get_faiss()
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def get_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Per-query search parameters for ANN indexes (None for exact indexes or when unset)
+
+    Parameters are passed per search call instead of mutating the index, so cached
+    indexes can be searched concurrently with different settings.
+    """
+    faiss = get_faiss()
+    index = faiss.downcast_index(index)
+
+    if isinstance(index, faiss.IndexIVF) and nprobe is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if isinstance(index, faiss.IndexHNSW) and ef_search is not None:
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def measure_recall(index: faiss.Index, embeddings: np.ndarray, k: int = ANN_RECALL_K, sample: int = ANN_RECALL_SAMPLE) -> float:
+    """recall@k of index against exact search, for perturbed copies of a sample of the indexed vectors
+
+    Each query's own vector is dropped from both result lists, so the trivial
+    self-match does not count towards recall.
+    """
+    faiss = get_faiss()
+    vector_count = embeddings.shape[0]
+    k = min(k, vector_count - 1)
+    if k < 1:
+        return 1.0
+
+    rng = np.random.default_rng(0)
+    query_ids = rng.choice(vector_count, size=min(sample, vector_count), replace=False)
+    noise = rng.normal(scale=0.01, size=(len(query_ids), embeddings.shape[1]))
+    queries = np.ascontiguousarray(embeddings[query_ids] + noise, dtype=np.float32)
+    faiss.normalize_L2(queries)
+
+    exact = faiss.IndexFlatIP(embeddings.shape[1])
+    exact.add(embeddings)
+    _, expected = exact.search(queries, k + 1)
+    _, found = index.search(queries, k + 1)
+
+    hits = 0
+    for query_id, expected_row, found_row in zip(query_ids, expected, found):
+        expected_row = [i for i in expected_row if i != query_id][:k]
+        found_row = [i for i in found_row if i not in (query_id, -1)][:k]
+        hits += len(set(expected_row) & set(found_row))
+    return hits / float(len(queries) * k)
@@ -0,0 +1,44 @@
+# Accessors for heavy ML / OCR / PDF dependencies.
+#
+# These libraries take from tens of milliseconds to seconds to import (faiss,
+# torch via sentence_transformers, OpenCV, PyMuPDF, ...). Modules that need them
+# call the accessor at first use instead of importing at module level, so
+# importing the app, or a process that only serves auth/analytics/bots, does not
+# pay for them. After the first call the module comes from sys.modules.
+#
+# Type annotations keep referring to e.g. faiss.Index through
+# `if TYPE_CHECKING: import faiss` plus `from __future__ import annotations`.
+
+
+def get_faiss():
+    import faiss
+    return faiss
+
+
+def get_cv2():
+    import cv2
+    return cv2
+
+
+def get_pytesseract():
+    import pytesseract
+    return pytesseract
+
+
+def get_pdfplumber():
+    import pdfplumber
+    return pdfplumber
+
+
+def get_fitz():
+    import fitz  # PyMuPDF
+    return fitz
+
+
+def get_convert_from_bytes():
+    from pdf2image import convert_from_bytes
+    return convert_from_bytes
+
+def get_convert_from_path():
+    from pdf2image import convert_from_path
+    return convert_from_path
@@ -0,0 +1,120 @@
+import os
+import re
+import numpy as np
+from collections import Counter
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+# Per-textbook BM25 inverted index, built at upload next to the FAISS index.
+#
+# Exact-term questions (vocabulary words, named formulas, proper names) are often
+# missed by embedding similarity; a lexical pass finds them cheaply. Rankings
+# from both retrievers are combined with reciprocal rank fusion.
+#
+# Postings are stored in CSR form (one contiguous slice of chunk rows and term
+# frequencies per term) in an .npz file with no pickled objects.
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can did do does for from had has have how i if in into is it its
+me my of on or our so than that the their them then there these they this to was we were what when
+where which who whom why will with would you your about also just more most some such very
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric terms without stopwords and single characters"""
+    return [
+        token for token in re.findall(r"[a-z0-9]+", text.lower())
+        if len(token) > 1 and token not in _STOPWORDS
+    ]
+
+
+class LexicalIndex:
+    """BM25 index over one textbook's chunk rows"""
+
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, rows: np.ndarray, term_freqs: np.ndarray, doc_lengths: np.ndarray):
+        self.terms = terms
+        self.offsets = offsets          # term i's postings are rows[offsets[i]:offsets[i + 1]]
+        self.rows = rows
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.term_ids = {term: i for i, term in enumerate(terms.tolist())}
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.terms.nbytes + self.offsets.nbytes + self.rows.nbytes + self.term_freqs.nbytes + self.doc_lengths.nbytes)
+
+    @classmethod
+    def build(cls, texts: Sequence[str]) -> "LexicalIndex":
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lengths = np.zeros(len(texts), dtype='int32')
+
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[row] = len(tokens)
+            for term, count in Counter(tokens).items():
+                postings.setdefault(term, []).append((row, count))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype='int64')
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        rows = np.fromiter((row for term in terms for row, _ in postings[term]), dtype='int32', count=int(offsets[-1]))
+        term_freqs = np.fromiter((count for term in terms for _, count in postings[term]), dtype='int32', count=int(offsets[-1]))
+
+        return cls(np.asarray(terms, dtype=str), offsets, rows, term_freqs, doc_lengths)
+
+    def save(self, path: str):
+        """Write the index atomically (tmp file + rename)"""
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(
+                f, terms=self.terms, offsets=self.offsets, rows=self.rows,
+                term_freqs=self.term_freqs, doc_lengths=self.doc_lengths
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["terms"], data["offsets"], data["rows"], data["term_freqs"], data["doc_lengths"])
+
+    def search(self, query: str, top_k: int = 5, k1: float = BM25_K1, b: float = BM25_B) -> List[Tuple[int, float]]:
+        """Top-k (row, BM25 score) for the query's terms; rows sharing no term are never returned"""
+        doc_count = len(self.doc_lengths)
+        if doc_count == 0:
+            return []
+
+        scores = np.zeros(doc_count, dtype='float32')
+        length_norm = k1 * (1 - b + b * self.doc_lengths / max(self.avg_length, 1e-9))
+
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.rows[start:end]
+            tf = self.term_freqs[start:end].astype('float32')
+            doc_freq = end - start
+            idf = np.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+            scores[rows] += idf * tf * (k1 + 1) / (tf + length_norm[rows])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        ranked = sorted(matched.tolist(), key=lambda row: -scores[row])
+        return [(row, float(scores[row])) for row in ranked]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """Fuse best-first rankings: score(item) = sum over rankings of 1 / (k + rank)"""
+    fused: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import numpy as np
+import os
+import pickle
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from app.utils.lazy_imports import get_faiss
+
+try:
+    import fcntl  # cross-process lock (POSIX only)
+except ImportError:
+    fcntl = None
+
+if TYPE_CHECKING:
+    import faiss
+
+# Per-user merged index over all of a user's textbooks ("library").
+# Vectors are stored under stable int64 ids in an IndexIDMap2 so whole textbooks
+# can be added and removed without rebuilding; the metadata maps each id back to
+# its textbook, page and chunk text.
+
+_library_locks = {}
+_library_locks_guard = threading.Lock()
+
+
+def get_user_library_paths(user_email: str) -> Tuple[str, str]:
+    """Get (index_path, meta_path) for a user's merged library index"""
+    safe_email = user_email.replace("@", "_").replace(".", "_")
+    return f"data/indexes/{safe_email}__library.index", f"data/chunks/{safe_email}__library.pkl"
+
+
+def get_user_library_lock(user_email: str) -> threading.Lock:
+    """Serializes read-modify-write updates of one user's library files within this process"""
+    with _library_locks_guard:
+        if user_email not in _library_locks:
+            _library_locks[user_email] = threading.Lock()
+        return _library_locks[user_email]
+
+
+@contextmanager
+def user_library_lock(user_email: str):
+    """Serializes read-modify-write updates of one user's library files, also across processes"""
+    index_path, _ = get_user_library_paths(user_email)
+    with get_user_library_lock(user_email):
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(f"{index_path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def new_user_library(dimension: int) -> Tuple[faiss.Index, dict]:
+    """Create an empty library index and metadata"""
+    faiss = get_faiss()
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+    meta = {"next_id": 0, "entries": {}, "textbooks": {}}
+    return index, meta
+
+
+def read_user_library(user_email: str) -> Optional[Tuple[faiss.Index, dict]]:
+    """Read a user's library from disk (None if the user has none yet)"""
+    faiss = get_faiss()
+    index_path, meta_path = get_user_library_paths(user_email)
+
+    if not os.path.exists(index_path) or not os.path.exists(meta_path):
+        return None
+
+    index = faiss.read_index(index_path)
+    with open(meta_path, 'rb') as f:
+        meta = pickle.load(f)
+
+    return index, meta
+
+
+def write_user_library(user_email: str, index: faiss.Index, meta: dict):
+    """Write a user's library to disk"""
+    faiss = get_faiss()
+    os.makedirs("data/indexes", exist_ok=True)
+    os.makedirs("data/chunks", exist_ok=True)
+
+    index_path, meta_path = get_user_library_paths(user_email)
+    # Replace, never rewrite in place: other processes may be reading the files
+    faiss.write_index(index, f"{index_path}.tmp")
+    with open(f"{meta_path}.tmp", 'wb') as f:
+        pickle.dump(meta, f)
+    os.replace(f"{index_path}.tmp", index_path)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+def remove_textbook(index: faiss.Index, meta: dict, textbook_id: str) -> int:
+    """Remove all of a textbook's vectors from the library; returns number removed"""
+    faiss = get_faiss()
+    textbook = meta["textbooks"].pop(textbook_id, None)
+    if not textbook:
+        return 0
+
+    ids = np.asarray(textbook["ids"], dtype='int64')
+    index.remove_ids(faiss.IDSelectorBatch(ids))
+    for vector_id in textbook["ids"]:
+        meta["entries"].pop(vector_id, None)
+
+    return len(ids)
+
+
+def add_textbook(
+    index: faiss.Index,
+    meta: dict,
+    textbook_id: str,
+    embeddings: np.ndarray,
+    chunks: List[dict],
+    subject: Optional[str] = None
+) -> int:
+    """Add (or replace) a textbook's normalized embeddings in the library; returns number added"""
+    if subject is None:
+        # Re-indexing an existing textbook keeps its subject
+        subject = meta["textbooks"].get(textbook_id, {}).get("subject")
+    remove_textbook(index, meta, textbook_id)
+
+    first_id = meta["next_id"]
+    ids = list(range(first_id, first_id + len(chunks)))
+    meta["next_id"] = first_id + len(chunks)
+
+    index.add_with_ids(embeddings, np.asarray(ids, dtype='int64'))
+
+    for vector_id, chunk in zip(ids, chunks):
+        meta["entries"][vector_id] = {
+            "textbook_id": textbook_id,
+            "subject": subject,
+            "page_number": chunk.get("page_number", 1),
+            "chunk_number": chunk.get("chunk_number", 1),
+            "content": chunk["content"]
+        }
+    meta["textbooks"][textbook_id] = {"subject": subject, "ids": ids}
+
+    return len(ids)
+
+
+def search_library(
+    index: faiss.Index,
+    meta: dict,
+    query_embedding: np.ndarray,
+    top_k: int = 5,
+    subject: Optional[str] = None,
+    min_score: float = 0.3
+) -> List[Dict]:
+    """Top-k chunks across all textbooks (optionally one subject) with textbook/page attribution"""
+    faiss = get_faiss()
+    params = None
+    if subject is not None:
+        subject_ids = [
+            vector_id
+            for textbook in meta["textbooks"].values() if textbook["subject"] == subject
+            for vector_id in textbook["ids"]
+        ]
+        if not subject_ids:
+            return []
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.asarray(subject_ids, dtype='int64')))
+
+    if params is not None:
+        scores, ids = index.search(query_embedding, top_k, params=params)
+    else:
+        scores, ids = index.search(query_embedding, top_k)
+
+    results = []
+    for score, vector_id in zip(scores[0], ids[0]):
+        entry = meta["entries"].get(int(vector_id))
+        if entry is None or score <= min_score:
+            continue
+        results.append({
+            "content": entry["content"],
+            "score": float(score),
+            "textbook_id": entry["textbook_id"],
+            "subject": entry["subject"],
+            "page_number": entry["page_number"],
+            "chunk_number": entry["chunk_number"]
+        })
+
+    return results
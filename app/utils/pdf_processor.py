@@ -1,90 +1,372 @@
-import PyPDF2
-import pdfplumber
-import pytesseract
-from pdf2image import convert_from_bytes
-import cv2
 import numpy as np
-from PIL import Image
 import io
+import multiprocessing
+import os
 import re
-from typing import List, Dict
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+from app.utils.lazy_imports import (
+    get_convert_from_bytes, get_convert_from_path, get_cv2, get_fitz, get_pdfplumber, get_pytesseract
+)
 
-def extract_text_hybrid(file_content: bytes) -> Dict[str, str]:
-    """Hybrid extraction: Regular text + OCR for comprehensive content"""
-    
-    print("Starting hybrid text extraction...")
-    
-    # Method 1: Regular pdfplumber extraction
-    print("Step 1: Regular text extraction...")
-    regular_text = extract_regular_text(file_content)
+# Ingestion is a per-page generator pipeline:
+#     text layer -> (render -> preprocess -> OCR) -> clean -> chunk
+# Only the pages currently being OCR'd are held as images and the PDF is read
+# from the saved upload file, so peak memory does not grow with the page count.
+#
+# Page-parallel OCR: pages are preprocessed and OCR'd in a process pool shared by
+# all uploads in this process. OCR_MAX_WORKERS caps the pool (and so the cores
+# used by concurrent uploads together); each upload keeps at most OCR_WORKERS
+# pages in flight.
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+OCR_WORKERS = min(int(os.getenv("OCR_WORKERS", str(OCR_MAX_WORKERS))), OCR_MAX_WORKERS)
+# Pages are rasterized for OCR in-process with PyMuPDF, straight to grayscale
+# (pdf2image / poppler only if PyMuPDF is unavailable)
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+TESSERACT_CONFIG = r'--oem 3 --psm 6 -l eng'
+
+# Selective OCR: only pages whose text layer has fewer than OCR_MIN_TEXT_CHARS
+# characters, or whose images cover at least OCR_IMAGE_AREA_FRACTION of the page,
+# are rendered and OCR'd; born-digital pages use their text layer as is
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "200"))
+OCR_IMAGE_AREA_FRACTION = float(os.getenv("OCR_IMAGE_AREA_FRACTION", "0.5"))
+
+# Text-layer extractor: pymupdf (fast, default) or pdfplumber. Documents PyMuPDF
+# cannot open (or a missing PyMuPDF install) fall back to pdfplumber.
+PDF_EXTRACTOR = os.getenv("PDF_EXTRACTOR", "pymupdf")
+PDF_EXTRACTORS = ("pymupdf", "pdfplumber")
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+# A saved PDF's path, or its bytes
+PdfSource = Union[str, bytes]
+
+def extract_pdf(source: PdfSource, chunk_size: int = 1000, workers: Optional[int] = None) -> Dict:
+    """Run the page pipeline over a PDF: chunks plus per-page extraction stats"""
     
-    # Method 2: OCR extraction for images/scanned content
-    print("Step 2: OCR extraction from images...")
-    ocr_text = extract_text_with_ocr(file_content)
+    print("Starting page-by-page extraction...")
+    chunks = []
+    page_count = 0
+    ocr_pages = []
+    total_chars = 0
+    ocr_chars = 0
     
-    # Method 3: Combine and deduplicate
-    print("Step 3: Combining and cleaning text...")
-    combined_text = combine_text_sources(regular_text, ocr_text)
+    for page in iter_page_texts(source, workers):
+        page_count += 1
+        total_chars += len(page["text"])
+        if page["ocr"]:
+            ocr_pages.append(page["page"])
+            ocr_chars += len(page["text"])
+        if len(page["text"]) > 20:
+            chunks.extend(chunk_page_text(page["text"], page["page"], chunk_size, len(chunks) + 1))
     
+    print(f"Extracted {total_chars} characters from {page_count} pages ({len(ocr_pages)} OCR'd), {len(chunks)} chunks")
     return {
-        "regular_text": regular_text,
-        "ocr_text": ocr_text,
-        "combined_text": combined_text,
-        "regular_chars": len(regular_text),
-        "ocr_chars": len(ocr_text),
-        "total_chars": len(combined_text)
+        "chunks": chunks,
+        "page_count": page_count,
+        "ocr_pages": ocr_pages,
+        "regular_chars": total_chars - ocr_chars,
+        "ocr_chars": ocr_chars,
+        "total_chars": total_chars
     }
 
-def extract_regular_text(file_content: bytes) -> str:
-    """Extract regular text using pdfplumber"""
-    try:
-        pdf_file = io.BytesIO(file_content)
-        text = ""
-        
-        with pdfplumber.open(pdf_file) as pdf:
+def _open_fitz(source: PdfSource):
+    fitz = get_fitz()
+    return fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+
+class PyMuPDFExtractor:
+    """Text layer and image boxes with PyMuPDF (MuPDF, several times faster than pdfplumber)"""
+
+    name = "pymupdf"
+
+    def page_count(self, source: PdfSource) -> int:
+        with self._open(source) as pdf:
+            return pdf.page_count
+
+    def iter_pages(self, source: PdfSource) -> Iterator[tuple]:
+        with self._open(source) as pdf:
+            for i in range(pdf.page_count):
+                try:
+                    page = pdf.load_page(i)
+                    # sort: top-to-bottom, left-to-right like pdfplumber rather than content-stream order
+                    text = page.get_text("text", sort=True)
+                    images = [
+                        {"x0": x0, "top": y0, "x1": x1, "bottom": y1}
+                        for x0, y0, x1, y1 in (info["bbox"] for info in page.get_image_info())
+                    ]
+                    yield i + 1, text, images, page.rect.width, page.rect.height
+                except Exception as e:
+                    print(f"Text extraction failed for page {i+1}: {e}")
+                    yield i + 1, "", [], 0, 0
+
+    def _open(self, source: PdfSource):
+        return _open_fitz(source)
+
+
+class PdfPlumberExtractor:
+    """Text layer and image boxes with pdfplumber (pdfminer)"""
+
+    name = "pdfplumber"
+
+    def page_count(self, source: PdfSource) -> int:
+        with self._open(source) as pdf:
+            return len(pdf.pages)
+
+    def iter_pages(self, source: PdfSource) -> Iterator[tuple]:
+        with self._open(source) as pdf:
             for i, page in enumerate(pdf.pages):
-                page_text = page.extract_text()
-                if page_text and len(page_text.strip()) > 20:
-                    text += f"\n=== Page {i+1} ===\n" + page_text + "\n"
-                    
-        print(f"Regular extraction: {len(text)} characters from {len(pdf.pages)} pages")
+                try:
+                    yield i + 1, page.extract_text() or "", page.images, page.width, page.height
+                except Exception as e:
+                    print(f"Text extraction failed for page {i+1}: {e}")
+                    yield i + 1, "", [], 0, 0
+                finally:
+                    # Drop the page's parsed layout objects before moving on
+                    page.close()
+
+    def _open(self, source: PdfSource):
+        pdfplumber = get_pdfplumber()
+        return pdfplumber.open(source if isinstance(source, str) else io.BytesIO(source))
+
+
+def create_pdf_extractor(name: str = PDF_EXTRACTOR):
+    """Instantiate a text-layer extractor by name"""
+    if name == "pymupdf":
+        return PyMuPDFExtractor()
+    if name == "pdfplumber":
+        return PdfPlumberExtractor()
+    raise ValueError(f"Unknown PDF extractor: {name} (expected one of {PDF_EXTRACTORS})")
+
+def _extractor_pages(source: PdfSource, extractor):
+    """(page number, text, image boxes, width, height) per page, falling back to pdfplumber if the extractor cannot open the PDF"""
+    pages = extractor.iter_pages(source)
+    try:
+        # Opening happens on the first page
+        first = next(pages, None)
+    except Exception as e:
+        if extractor.name == "pdfplumber":
+            raise
+        print(f"{extractor.name} could not read the PDF ({e}), falling back to pdfplumber")
+        pages = PdfPlumberExtractor().iter_pages(source)
+        first = next(pages, None)
+    
+    if first is not None:
+        yield first
+        yield from pages
+
+def pdf_page_count(source: PdfSource, extractor=None) -> int:
+    extractor = extractor or create_pdf_extractor()
+    try:
+        return extractor.page_count(source)
+    except Exception:
+        if extractor.name == "pdfplumber":
+            raise
+        return PdfPlumberExtractor().page_count(source)
+
+def iter_pdf_pages(source: PdfSource, extractor=None) -> Iterator[Dict]:
+    """Per page, one at a time: text layer, its length, image coverage and whether it needs OCR"""
+    for page_number, text, images, width, height in _extractor_pages(source, extractor or create_pdf_extractor()):
+        image_fraction = image_area_fraction(images, width, height)
+        yield {
+            "page": page_number,
+            "text": text,
+            "text_chars": len(text.strip()),
+            "image_fraction": round(image_fraction, 3),
+            "needs_ocr": needs_ocr(text, image_fraction)
+        }
+
+def image_area_fraction(images: List[Dict], width: float, height: float) -> float:
+    """Fraction of the page covered by images (bounding boxes clipped to the page, overlaps counted twice)"""
+    if not width or not height:
+        return 0.0
+    area = 0.0
+    for image in images:
+        x0, x1 = max(0.0, float(image["x0"])), min(float(width), float(image["x1"]))
+        top, bottom = max(0.0, float(image["top"])), min(float(height), float(image["bottom"]))
+        area += max(0.0, x1 - x0) * max(0.0, bottom - top)
+    return min(1.0, area / (float(width) * float(height)))
+
+def needs_ocr(text: str, image_fraction: float) -> bool:
+    """OCR a page whose text layer is missing or thin, or that is mostly image"""
+    return len(text.strip()) < OCR_MIN_TEXT_CHARS or image_fraction >= OCR_IMAGE_AREA_FRACTION
+
+def extract_regular_text(source: PdfSource) -> str:
+    """Extract the text layer of every page with the configured extractor (PDF_EXTRACTOR)"""
+    try:
+        text = "".join(
+            f"\n=== Page {page['page']} ===\n" + page["text"] + "\n"
+            for page in iter_pdf_pages(source) if len(page["text"].strip()) > 20
+        )
         return clean_text(text)
-        
     except Exception as e:
         print(f"Regular extraction failed: {e}")
         return ""
 
-def extract_text_with_ocr(file_content: bytes, max_pages: int = 50) -> str:
-    """Extract text from PDF using OCR on page images"""
+@contextmanager
+def page_renderer(source: PdfSource, dpi: int = OCR_DPI):
+    """render(page_number) -> grayscale uint8 image of a (1-based) page; the PDF stays open between pages"""
+    try:
+        document = _open_fitz(source)
+    except Exception as e:
+        print(f"PyMuPDF rendering unavailable ({e}), using pdf2image")
+        document = None
+    
+    try:
+        if document is not None:
+            yield lambda page_number: _render_pymupdf(document, page_number, dpi)
+        else:
+            yield lambda page_number: _render_pdf2image(source, page_number, dpi)
+    finally:
+        if document is not None:
+            document.close()
+
+def _render_pymupdf(document, page_number: int, dpi: int) -> np.ndarray:
+    fitz = get_fitz()
+    page = document.load_page(page_number - 1)
+    pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    # One byte per pixel; rows may be padded to the stride
+    image = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)
+    return image[:, :pixmap.width]
+
+def _render_pdf2image(source: PdfSource, page_number: int, dpi: int) -> np.ndarray:
+    if isinstance(source, str):
+        images = get_convert_from_path()(source, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True)
+    else:
+        images = get_convert_from_bytes()(source, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True)
+    return np.array(images[0])
+
+def _init_ocr_worker():
+    # One page per process: keep Tesseract's OpenMP from starting a thread per core in every worker
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    """Shared OCR process pool, started on first use"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            # spawn, not fork: the API process runs threads (event loop, model pools)
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=OCR_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_ocr_worker
+            )
+        return _ocr_pool
+
+def ocr_page(image: np.ndarray) -> str:
+    """Preprocess one grayscale page image and OCR it (runs in an OCR worker process)"""
+    pytesseract = get_pytesseract()
+    
+    # Preprocess for better OCR
+    processed = preprocess_for_ocr(image)
+    
+    # Extract text using Tesseract with configuration
+    return pytesseract.image_to_string(processed, config=TESSERACT_CONFIG)
+
+def _ocr_workers(workers: Optional[int], executor: Optional[Executor]) -> int:
+    workers = max(1, workers or OCR_WORKERS)
+    if executor is None:
+        # The shared pool never runs more than OCR_MAX_WORKERS pages at once anyway
+        workers = min(workers, OCR_MAX_WORKERS)
+    return workers
+
+def _submit_ocr(image: np.ndarray, executor: Optional[Executor]) -> Future:
+    if executor is not None:
+        return executor.submit(ocr_page, image)
+    
+    # Single worker: not worth a process round-trip
+    future = Future()
+    try:
+        future.set_result(ocr_page(image))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def _ocr_result(page_number: int, future: Future) -> str:
+    try:
+        return future.result()
+    except Exception as page_error:
+        print(f"OCR failed for page {page_number}: {page_error}")
+        return ""
+
+def iter_ocr_pages(images: Iterable[np.ndarray], workers: Optional[int] = None, executor: Optional[Executor] = None) -> Iterator[str]:
+    """OCR text of each page image, in page order ("" for pages that failed)
+    
+    Up to `workers` pages are OCR'd in parallel on the shared pool (or `executor`);
+    images are consumed lazily, so at most that many are held at once.
+    """
+    workers = _ocr_workers(workers, executor)
+    if executor is None and workers > 1:
+        executor = get_ocr_pool()
+    
+    in_flight = deque()
+    for i, image in enumerate(images):
+        if len(in_flight) >= workers:
+            # Oldest page first keeps the output in page order
+            yield _ocr_result(*in_flight.popleft())
+        in_flight.append((i + 1, _submit_ocr(image, executor)))
+    while in_flight:
+        yield _ocr_result(*in_flight.popleft())
+
+def iter_page_texts(source: PdfSource, workers: Optional[int] = None, executor: Optional[Executor] = None) -> Iterator[Dict]:
+    """Cleaned text of each page, in page order: {"page", "text", "ocr"}
+    
+    Pages that need OCR are rendered only when a worker is free for them; pages
+    after a page still being OCR'd wait behind it (at most 4 * workers pages).
+    """
+    workers = _ocr_workers(workers, executor)
+    if executor is None and workers > 1:
+        executor = get_ocr_pool()
+    window = 4 * workers
+    
+    pending = deque()  # (page, OCR future or None), oldest first
     
+    def finish(page: Dict, future: Optional[Future]) -> Dict:
+        ocr_text = _ocr_result(page["page"], future) if future is not None else ""
+        text = merge_page_text(page["text"], ocr_text)
+        return {
+            "page": page["page"],
+            "text": clean_text(text),
+            # Only pages whose text actually includes OCR output count as OCR'd
+            "ocr": text != page["text"].strip()
+        }
+    
+    with page_renderer(source) as render_page:
+        for page in iter_pdf_pages(source):
+            future = None
+            if page["needs_ocr"]:
+                # No more than `workers` rendered pages at once
+                while sum(1 for _, f in pending if f is not None and not f.done()) >= workers:
+                    yield finish(*pending.popleft())
+                try:
+                    future = _submit_ocr(render_page(page["page"]), executor)
+                except Exception as e:
+                    print(f"Rendering failed for page {page['page']}: {e}")
+            
+            pending.append((page, future))
+            while pending and (pending[0][1] is None or pending[0][1].done() or len(pending) > window):
+                yield finish(*pending.popleft())
+    
+    while pending:
+        yield finish(*pending.popleft())
+
+def extract_text_with_ocr(source: PdfSource, max_pages: Optional[int] = None, workers: Optional[int] = None) -> str:
+    """Extract text from PDF using OCR on page images (all pages, or the first max_pages)"""
     try:
-        print("Converting PDF pages to images...")
-        # Convert PDF to images (limit pages for performance)
-        images = convert_from_bytes(file_content, dpi=200, first_page=1, last_page=max_pages)
+        page_count = pdf_page_count(source)
+        if max_pages is not None:
+            page_count = min(page_count, max_pages)
         
         ocr_text = ""
-        
-        for i, image in enumerate(images):
-            print(f"OCR processing page {i+1}/{len(images)}...")
-            
-            try:
-                # Convert PIL to OpenCV
-                opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-                
-                # Preprocess for better OCR
-                processed = preprocess_for_ocr(opencv_image)
-                
-                # Extract text using Tesseract with configuration
-                custom_config = r'--oem 3 --psm 6 -l eng'
-                page_text = pytesseract.image_to_string(processed, config=custom_config)
-                
+        with page_renderer(source) as render_page:
+            images = (render_page(page_number) for page_number in range(1, page_count + 1))
+            for page_number, page_text in enumerate(iter_ocr_pages(images, workers), start=1):
                 # Only add meaningful content
                 if page_text.strip() and len(page_text.strip()) > 10:
-                    ocr_text += f"\n=== Page {i+1} (OCR) ===\n" + page_text + "\n"
-                    
-            except Exception as page_error:
-                print(f"OCR failed for page {i+1}: {page_error}")
-                continue
+                    ocr_text += f"\n=== Page {page_number} (OCR) ===\n" + page_text + "\n"
         
         print(f"OCR extraction: {len(ocr_text)} characters")
         return clean_text(ocr_text)
@@ -94,10 +376,11 @@ def extract_text_with_ocr(file_content: bytes, max_pages: int = 50) -> str:
         return ""
 
 def preprocess_for_ocr(image):
-    """Enhance image for better OCR accuracy"""
+    """Enhance image (grayscale, or OpenCV BGR) for better OCR accuracy"""
+    cv2 = get_cv2()
     
     # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     
     # Noise reduction
     denoised = cv2.medianBlur(gray, 3)
@@ -117,24 +400,27 @@ def preprocess_for_ocr(image):
     
     return cleaned
 
-def combine_text_sources(regular_text: str, ocr_text: str) -> str:
-    """Intelligently combine regular text and OCR text, removing duplicates"""
-    
-    if not regular_text and not ocr_text:
-        return ""
-    
-    if not regular_text:
-        return ocr_text
-    
-    if not ocr_text:
-        return regular_text
+def _normalized_line(text: str) -> str:
+    return re.sub(r'\W+', ' ', text).strip().lower()
+
+def merge_page_text(text: str, ocr_text: str) -> str:
+    """A page's text layer with its OCR text merged in, without duplicating what the layer has"""
+    text = text.strip()
+    ocr_text = ocr_text.strip()
+    if not ocr_text or len(ocr_text) <= 10:
+        return text
     
-    # Simple combination for now - can be enhanced with deduplication
-    combined = regular_text + "\n\n" + "="*50 + "\n"
-    combined += "ADDITIONAL OCR CONTENT (Images, Diagrams, Scanned Text)\n"
-    combined += "="*50 + "\n\n" + ocr_text
+    if len(text) < OCR_MIN_TEXT_CHARS:
+        # Thin or missing text layer: the OCR text is the page
+        return ocr_text if len(ocr_text) > len(text) else text
     
-    return combined
+    # Image-heavy page with a real text layer: add what only the OCR saw (diagram labels, ...)
+    known = _normalized_line(text)
+    extra = [
+        line for line in ocr_text.splitlines()
+        if _normalized_line(line) and _normalized_line(line) not in known
+    ]
+    return text + "\n\n" + "\n".join(extra) if extra else text
 
 def clean_text(text: str) -> str:
     """Enhanced text cleaning"""
@@ -160,7 +446,6 @@ def chunk_text_smart(text: str, chunk_size: int = 1000, overlap: int = 150) -> L
     page_sections = text.split('=== Page ')
     
     chunks = []
-    chunk_number = 1
     
     for page_section in page_sections[1:]:  # Skip first empty split
         # Extract page number from section
@@ -173,46 +458,51 @@ def chunk_text_smart(text: str, chunk_size: int = 1000, overlap: int = 150) -> L
         else:
             page_content = page_section.strip()
         
-        # Create chunks for this page
-        paragraphs = page_content.split('\n\n')
-        current_chunk = ""
-        current_length = 0
-        
-        for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if not paragraph:
-                continue
-                
-            paragraph_length = len(paragraph.split())
+        chunks.extend(chunk_page_text(page_content, page_num, chunk_size, len(chunks) + 1))
+    
+    return chunks
+
+def chunk_page_text(page_content: str, page_num: int, chunk_size: int = 1000, chunk_number: int = 1) -> List[Dict]:
+    """Chunks of one page's text (paragraphs packed up to chunk_size words), numbered from chunk_number"""
+    chunks = []
+    paragraphs = page_content.split('\n\n')
+    current_chunk = ""
+    current_length = 0
+    
+    for paragraph in paragraphs:
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
             
-            if current_length + paragraph_length > chunk_size and current_chunk:
-                # Save chunk with page number
-                chunks.append({
-                    "chunk_number": chunk_number,
-                    "content": current_chunk.strip(),
-                    "word_count": current_length,
-                    "char_count": len(current_chunk),
-                    "content_type": "hybrid",
-                    "page_number": page_num  # ADD THIS!
-                })
-                chunk_number += 1
-                current_chunk = paragraph
-                current_length = paragraph_length
-            else:
-                current_chunk += "\n\n" + paragraph if current_chunk else paragraph
-                current_length += paragraph_length
+        paragraph_length = len(paragraph.split())
         
-        # Add final chunk for this page
-        if current_chunk.strip():
+        if current_length + paragraph_length > chunk_size and current_chunk:
+            # Save chunk with page number
             chunks.append({
                 "chunk_number": chunk_number,
                 "content": current_chunk.strip(),
                 "word_count": current_length,
                 "char_count": len(current_chunk),
                 "content_type": "hybrid",
-                "page_number": page_num  # ADD THIS!
+                "page_number": page_num
             })
             chunk_number += 1
+            current_chunk = paragraph
+            current_length = paragraph_length
+        else:
+            current_chunk += "\n\n" + paragraph if current_chunk else paragraph
+            current_length += paragraph_length
+    
+    # Add final chunk for this page
+    if current_chunk.strip():
+        chunks.append({
+            "chunk_number": chunk_number,
+            "content": current_chunk.strip(),
+            "word_count": current_length,
+            "char_count": len(current_chunk),
+            "content_type": "hybrid",
+            "page_number": page_num
+        })
     
     return chunks
 
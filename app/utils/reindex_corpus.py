@@ -0,0 +1,292 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional
+
+from pymongo import MongoClient
+
+from app.database import MONGODB_URL, DATABASE_NAME
+from app.utils.embedding_backends import embedding_cache_key, EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME
+from app.utils.faiss_indexes import INDEX_TYPES, COMPRESSIONS
+from app.utils.vector_processor import process_chunks_to_vectors, activate_textbook_vectors
+
+# Re-embed and re-index every textbook from the textbook_chunks collection, e.g.
+# after changing EMBEDDING_MODEL / EMBEDDING_BACKEND or the index type:
+#
+#     python -m app.utils.reindex_corpus --workers 4
+#
+# Textbooks are rebuilt in parallel worker processes, each writing a new snapshot
+# version next to the textbook's current one. Progress is checkpointed after every
+# textbook; running the same command again after an interruption continues with
+# the textbooks that are not done yet.
+#
+# For a model change, write the new versions with --stage (the API keeps serving
+# the old ones), then switch every textbook over with --activate and restart the
+# API with the new model.
+
+REINDEX_WORKERS = int(os.getenv("REINDEX_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+REINDEX_CHECKPOINT = os.getenv("REINDEX_CHECKPOINT", "data/reindex_checkpoint.json")
+
+# Per worker process
+_db = None
+
+
+def _init_worker():
+    global _db
+    _db = MongoClient(MONGODB_URL)[DATABASE_NAME]
+
+
+def _textbook_key(user_email: str, textbook_id: str) -> str:
+    return f"{user_email}/{textbook_id}"
+
+
+def list_textbooks(db, user_email: Optional[str] = None) -> List[dict]:
+    """Every textbook that has chunks, with its subject and chunk count, largest first"""
+    pipeline = [
+        {"$match": {"user_email": user_email} if user_email else {}},
+        {"$group": {
+            "_id": {"user_email": "$user_email", "textbook_id": "$textbook_id"},
+            "subject": {"$first": "$subject"},
+            "chunk_count": {"$sum": 1}
+        }},
+        # Largest first, so a big textbook does not start last and leave the other workers idle
+        {"$sort": {"chunk_count": -1}}
+    ]
+    return [
+        {
+            "user_email": group["_id"]["user_email"],
+            "textbook_id": group["_id"]["textbook_id"],
+            "subject": group.get("subject"),
+            "chunk_count": group["chunk_count"]
+        }
+        for group in db.textbook_chunks.aggregate(pipeline, allowDiskUse=True)
+    ]
+
+
+def reindex_textbook(
+    user_email: str,
+    textbook_id: str,
+    subject: Optional[str],
+    index_type: Optional[str],
+    compression: Optional[str],
+    activate: bool
+) -> dict:
+    """Rebuild one textbook's vectors from its database chunks (runs in a worker process)"""
+    start = time.perf_counter()
+    documents = list(_db.textbook_chunks.find(
+        {"textbook_id": textbook_id, "user_email": user_email},
+        {"content": 1, "page_number": 1, "chunk_number": 1}
+    ).sort("chunk_number", 1))
+    fetch_seconds = time.perf_counter() - start
+
+    chunks = [
+        {
+            "content": document["content"],
+            "page_number": document.get("page_number", 1),
+            "chunk_number": document.get("chunk_number", i + 1)
+        }
+        for i, document in enumerate(documents)
+    ]
+    index_path, _, embedding_stats = process_chunks_to_vectors(
+        user_email, textbook_id, chunks,
+        subject=subject,
+        chunk_ids=[str(document["_id"]) for document in documents],
+        index_type=index_type,
+        compression=compression,
+        activate=activate
+    )
+    seconds = time.perf_counter() - start
+
+    return {
+        "version": os.path.basename(os.path.dirname(index_path)),
+        "activated": activate,
+        "chunks": len(chunks),
+        "fetch_seconds": round(fetch_seconds, 3),
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(len(chunks) / seconds, 1) if seconds > 0 else 0.0,
+        "embedding_cache": embedding_stats
+    }
+
+
+def run_settings(index_type: Optional[str], compression: Optional[str], stage: bool) -> dict:
+    """Settings a checkpoint is only valid for"""
+    return {
+        "model": embedding_cache_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND),
+        "index_type": index_type,
+        "compression": compression,
+        "stage": stage
+    }
+
+
+def load_checkpoint(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """Write the checkpoint atomically (tmp file + rename)"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def reindex_corpus(
+    workers: int = REINDEX_WORKERS,
+    checkpoint_path: str = REINDEX_CHECKPOINT,
+    index_type: Optional[str] = None,
+    compression: Optional[str] = None,
+    stage: bool = False,
+    user_email: Optional[str] = None,
+    restart: bool = False
+) -> int:
+    """Re-index all textbooks not done in the checkpoint; returns the number that failed"""
+    settings = run_settings(index_type, compression, stage)
+    checkpoint = None if restart else load_checkpoint(checkpoint_path)
+    if checkpoint is None:
+        checkpoint = {"settings": settings, "textbooks": {}}
+    elif checkpoint["settings"] != settings:
+        raise SystemExit(
+            f"{checkpoint_path} belongs to a run with {checkpoint['settings']}; "
+            "use the same settings to resume or --restart"
+        )
+    done = checkpoint["textbooks"]
+
+    textbooks = list_textbooks(MongoClient(MONGODB_URL)[DATABASE_NAME], user_email)
+    pending = [
+        textbook for textbook in textbooks
+        if done.get(_textbook_key(textbook["user_email"], textbook["textbook_id"]), {}).get("status") != "done"
+    ]
+    print(
+        f"{len(textbooks)} textbooks, {len(textbooks) - len(pending)} already done, "
+        f"re-indexing {len(pending)} with {workers} workers ({settings['model']})"
+    )
+    if not pending:
+        return 0
+
+    # Split the cores between the workers so their thread pools do not oversubscribe
+    # them; spawned workers inherit the environment (explicit settings win)
+    threads = str(max(1, (os.cpu_count() or 1) // workers))
+    for variable in ("OMP_NUM_THREADS", "ONNX_THREADS"):
+        os.environ.setdefault(variable, threads)
+
+    start = time.perf_counter()
+    total_chunks = 0
+    failed = 0
+    # spawn, not fork: MongoClient and the faiss/torch thread pools are not fork-safe
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+    ) as pool:
+        futures = {
+            pool.submit(
+                reindex_textbook, textbook["user_email"], textbook["textbook_id"], textbook["subject"],
+                index_type, compression, not stage
+            ): textbook
+            for textbook in pending
+        }
+        for future in as_completed(futures):
+            textbook = futures[future]
+            key = _textbook_key(textbook["user_email"], textbook["textbook_id"])
+            entry = {
+                "user_email": textbook["user_email"],
+                "textbook_id": textbook["textbook_id"],
+                "subject": textbook["subject"]
+            }
+            try:
+                result = future.result()
+                entry.update(result, status="done")
+                total_chunks += result["chunks"]
+                print(
+                    f"✅ {key}: {result['chunks']} chunks in {result['seconds']:.1f}s "
+                    f"({result['chunks_per_second']:.1f} chunks/s, "
+                    f"{result['embedding_cache']['cache_hits']} from cache) -> {result['version']}"
+                )
+            except Exception as e:
+                entry.update(status="failed", error=str(e))
+                failed += 1
+                print(f"❌ {key}: {e}")
+
+            done[key] = entry
+            save_checkpoint(checkpoint_path, checkpoint)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Re-indexed {len(pending) - failed}/{len(pending)} textbooks, {total_chunks} chunks in "
+        f"{elapsed:.1f}s ({total_chunks / elapsed if elapsed > 0 else 0:.1f} chunks/s)"
+    )
+    if stage and not failed:
+        print("New versions are written but not served; switch to them with --activate")
+    return failed
+
+
+def activate_staged(checkpoint_path: str = REINDEX_CHECKPOINT) -> int:
+    """Serve the versions written by a completed --stage run; returns the number activated"""
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is None or not checkpoint["settings"]["stage"]:
+        raise SystemExit(f"{checkpoint_path} is not the checkpoint of a --stage run")
+
+    expected = run_settings(
+        checkpoint["settings"]["index_type"], checkpoint["settings"]["compression"], True
+    )
+    if checkpoint["settings"] != expected:
+        raise SystemExit(
+            f"Staged vectors were built with {checkpoint['settings']['model']}; "
+            f"activate with the same embedding settings (now {expected['model']})"
+        )
+
+    entries = checkpoint["textbooks"].values()
+    failed = [entry for entry in entries if entry["status"] != "done"]
+    if failed:
+        raise SystemExit(f"{len(failed)} textbooks failed to re-index; resume the --stage run first")
+
+    activated = 0
+    for entry in entries:
+        if entry.get("activated"):
+            continue
+        activate_textbook_vectors(entry["user_email"], entry["textbook_id"], entry["version"], entry["subject"])
+        entry["activated"] = True
+        activated += 1
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    print(f"Activated {activated} textbooks")
+    return activated
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Re-embed and re-index all textbooks from the database")
+    parser.add_argument("--workers", type=int, default=REINDEX_WORKERS, help="parallel worker processes")
+    parser.add_argument("--checkpoint", default=REINDEX_CHECKPOINT)
+    parser.add_argument("--index-type", choices=("auto",) + INDEX_TYPES, default=None)
+    parser.add_argument("--compression", choices=COMPRESSIONS, default=None)
+    parser.add_argument("--user", default=None, help="only re-index this user's textbooks")
+    parser.add_argument("--stage", action="store_true", help="write new versions without serving them")
+    parser.add_argument("--activate", action="store_true", help="serve the versions written by a --stage run")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    if args.activate:
+        activate_staged(args.checkpoint)
+        return
+
+    failed = reindex_corpus(
+        workers=max(1, args.workers),
+        checkpoint_path=args.checkpoint,
+        index_type=args.index_type,
+        compression=args.compression,
+        stage=args.stage,
+        user_email=args.user,
+        restart=args.restart
+    )
+    if failed:
+        print(f"{failed} textbooks failed; run the same command again to retry them")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
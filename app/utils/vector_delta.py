@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import numpy as np
+import os
+import pickle
+import uuid
+from typing import Dict, List, Optional
+from app.utils.lazy_imports import get_faiss
+
+# Write-ahead delta for incremental textbook index updates.
+#
+# A textbook's saved index ("base") is never modified in place. Chunk upserts and
+# removals are appended as pickled records to data/deltas/<textbook>.wal and
+# replayed into a VectorDelta: a small ID-mapped flat index of new/replaced chunks
+# plus the set of chunk ids hidden in the base. Searches merge base and delta;
+# compaction folds the delta into a new base and deletes the log.
+#
+# Records are idempotent (upsert/remove by chunk id), so replaying a log over a
+# base that already contains it is harmless.
+
+
+def get_delta_path(user_email: str, textbook_id: str) -> str:
+    """Path of a textbook's write-ahead delta log"""
+    safe_email = user_email.replace("@", "_").replace(".", "_")
+    return f"data/deltas/{safe_email}_{textbook_id}.wal"
+
+
+def chunk_label(chunk_id: str) -> int:
+    """Stable non-negative int64 FAISS label for a chunk UUID"""
+    return uuid.UUID(chunk_id).int >> 65
+
+
+class VectorDelta:
+    """In-memory state of a textbook's delta log"""
+
+    def __init__(self, dimension: int):
+        faiss = get_faiss()
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        self.entries = {}       # label -> chunk record (without vector)
+        self.removed = set()    # base chunk ids hidden by an upsert or remove
+        self.record_count = 0
+        self.lexical = None     # BM25 index over live_chunks(), built on first hybrid search
+
+    def apply(self, record: dict):
+        label = chunk_label(record["chunk_id"])
+
+        if label in self.entries:
+            self.index.remove_ids(np.asarray([label], dtype='int64'))
+            del self.entries[label]
+        self.removed.add(record["chunk_id"])
+
+        if record["op"] == "upsert":
+            vector = np.asarray(record["vector"], dtype='float32').reshape(1, -1)
+            self.index.add_with_ids(vector, np.asarray([label], dtype='int64'))
+            self.entries[label] = {key: value for key, value in record.items() if key not in ("op", "vector")}
+
+        self.record_count += 1
+        self.lexical = None
+
+    def search(self, query_embedding: np.ndarray, top_k: int) -> List[Dict]:
+        """Top-k delta chunks as records with a "score" field"""
+        return self.search_batch(query_embedding, top_k)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int) -> List[List[Dict]]:
+        """search() for each row of a (Q, d) query matrix, in one index pass"""
+        if self.index.ntotal == 0:
+            return [[] for _ in range(len(query_embeddings))]
+
+        scores, labels = self.index.search(query_embeddings, min(top_k, self.index.ntotal))
+        results = []
+        for row_scores, row_labels in zip(scores, labels):
+            row_results = []
+            for score, label in zip(row_scores, row_labels):
+                entry = self.entries.get(int(label))
+                if entry is not None:
+                    row_results.append(dict(entry, score=float(score)))
+            results.append(row_results)
+        return results
+
+    def live_chunks(self) -> List[dict]:
+        """Chunks currently added/replaced by the delta"""
+        return list(self.entries.values())
+
+
+def upsert_record(chunk_id: str, content: str, vector: np.ndarray, page_number: int = 1, chunk_number: int = 0) -> dict:
+    return {
+        "op": "upsert",
+        "chunk_id": chunk_id,
+        "content": content,
+        "page_number": page_number,
+        "chunk_number": chunk_number,
+        "vector": np.asarray(vector, dtype='float32')
+    }
+
+
+def remove_record(chunk_id: str) -> dict:
+    return {"op": "remove", "chunk_id": chunk_id}
+
+
+def append_records(path: str, records: List[dict]):
+    """Durably append records to a delta log"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "ab") as f:
+        for record in records:
+            pickle.dump(record, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_delta(path: str, dimension: int) -> Optional[VectorDelta]:
+    """Replay a delta log (None if there is none); a torn trailing record is ignored"""
+    if not os.path.exists(path):
+        return None
+
+    delta = VectorDelta(dimension)
+    with open(path, "rb") as f:
+        while True:
+            try:
+                record = pickle.load(f)
+            except EOFError:
+                break
+            except Exception as e:
+                print(f"Ignoring incomplete delta record in {path}: {e}")
+                break
+            delta.apply(record)
+
+    return delta
@@ -1,186 +1,1321 @@
-import faiss
+from __future__ import annotations
+
+import asyncio
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
 import os
 import pickle
+import re
+import shutil
+import threading
 import uuid
+from app.utils.lru_cache import LRUCache
+from app.utils.embedding_batcher import EmbeddingBatcher
+from app.utils import library_index
+from app.utils.chunk_store import ChunkStore, write_chunk_store
+from app.utils.embedding_store import EmbeddingStore, split_cached
+from app.utils.embedding_backends import (
+    create_embedding_backend, embedding_cache_key, EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND
+)
+from app.utils.embedding_server import RemoteEmbeddingBackend, EMBEDDING_SERVER_SOCKET
+from app.utils import vector_delta
+from app.utils.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from app.utils.answer_cache import answer_cache
+from app.utils.faiss_indexes import (
+    resolve_index_type, resolve_compression, compression_fallbacks, build_index, describe_index_type,
+    index_compression, get_search_params, measure_recall, read_index, ANN_MIN_RECALL, INDEX_LOAD_MODE
+)
+from app.utils.lazy_imports import get_faiss
+
+try:
+    import fcntl  # cross-process lock (POSIX only)
+except ImportError:
+    fcntl = None
+from app.utils.vector_snapshots import (
+    Snapshot, SnapshotError, get_snapshot_root, current_version, open_snapshot, begin_snapshot,
+    publish_snapshot, activate_version, abort_snapshot, verify_snapshot, remove_snapshots, SNAPSHOT_VERIFY_CHECKSUMS,
+    INDEX_FILE, CHUNKS_FILE, LEXICAL_FILE, IDS_FILE
+)
 
-# Load sentence transformer model (cached after first use)
+if TYPE_CHECKING:
+    import faiss
+
+# Embedding backend (EMBEDDING_BACKEND: torch / onnx / onnx-int8), loaded on first use;
+# with EMBEDDING_SERVER_SOCKET set, encoding is delegated to the shared embedding server
 model = None
 
+# Persistent chunk-embedding cache keyed by model + SHA-256 of the chunk text
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+_embedding_store = None
+
+# In-memory cache of loaded (index, chunks) pairs keyed by (user_email, textbook_id)
+VECTOR_CACHE_MAX_ENTRIES = int(os.getenv("VECTOR_CACHE_MAX_ENTRIES", "64"))
+VECTOR_CACHE_MAX_BYTES = int(os.getenv("VECTOR_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+_vector_cache = LRUCache(max_entries=VECTOR_CACHE_MAX_ENTRIES, max_bytes=VECTOR_CACHE_MAX_BYTES)
+
+# Query embeddings keyed by normalized question text (students repeat the same questions)
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "4096"))
+_query_embedding_cache = LRUCache(max_entries=QUERY_CACHE_MAX_ENTRIES)
+
+# Concurrent query encodes are coalesced into one batched model call
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+_query_batcher = None
+
+# Index loading and FAISS search run here, off the event loop
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "4"))
+_retrieval_executor = None
+
+# Incremental updates: delta logs with this many records are compacted in the background
+DELTA_COMPACT_RECORDS = int(os.getenv("DELTA_COMPACT_RECORDS", "256"))
+_compaction_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compaction")
+_compactions_pending = set()
+_textbook_locks = {}
+_textbook_locks_guard = threading.Lock()
+
+# Hybrid retrieval: each retriever contributes this many candidates per result to the fused ranking
+HYBRID_CANDIDATES_PER_RESULT = int(os.getenv("HYBRID_CANDIDATES_PER_RESULT", "4"))
+
+class TextbookVectors(NamedTuple):
+    """A textbook's loaded base index, chunk store, chunk ids, pending delta and BM25 index"""
+    index: faiss.Index
+    chunks: ChunkStore
+    chunk_ids: Optional[List[str]]
+    delta: Optional[vector_delta.VectorDelta]
+    lexical: Optional[LexicalIndex]
+
 def get_embedding_model():
-    """Get or initialize the embedding model"""
+    """Get or initialize the embedding model (the configured backend, or a client of the embedding server)"""
     global model
     if model is None:
-        print("Loading sentence transformer model...")
-        model = SentenceTransformer('all-MiniLM-L6-v2')  # Fast and good quality
-        print("Model loaded successfully!")
+        load_local = partial(create_embedding_backend, EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME)
+        if EMBEDDING_SERVER_SOCKET:
+            # Shared embedding server; the model is only loaded here if the server is unavailable
+            model = RemoteEmbeddingBackend(EMBEDDING_SERVER_SOCKET, load_local, EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+            print(f"Using embedding server at {EMBEDDING_SERVER_SOCKET}")
+        else:
+            print(f"Loading embedding model {EMBEDDING_MODEL_NAME} ({EMBEDDING_BACKEND} backend)...")
+            model = load_local()
+            print("Model loaded successfully!")
     return model
 
+def get_embedding_store() -> Optional[EmbeddingStore]:
+    """Get the persistent chunk-embedding cache (None when disabled)"""
+    global _embedding_store
+    if EMBEDDING_CACHE_ENABLED and _embedding_store is None:
+        _embedding_store = EmbeddingStore(embedding_cache_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND))
+    return _embedding_store
+
+def create_embeddings_with_stats(chunks: List[str]) -> Tuple[np.ndarray, dict]:
+    """Convert text chunks to vector embeddings, encoding only chunks not seen before"""
+    store = get_embedding_store()
+    
+    try:
+        digests, found, misses = split_cached(store, chunks)
+    except Exception as e:
+        print(f"Embedding cache lookup failed: {e}")
+        digests, found, misses = split_cached(None, chunks)
+    
+    print(f"Creating embeddings for {len(chunks)} chunks ({len(found)} cached, {len(misses)} to encode)...")
+    
+    encoded = None
+    if misses:
+        model = get_embedding_model()
+        miss_positions = list(misses.values())
+        encoded = model.encode([chunks[i] for i in miss_positions], show_progress_bar=True).astype('float32')
+        
+        if store is not None:
+            try:
+                store.put_many(list(misses.keys()), encoded)
+            except Exception as e:
+                print(f"Embedding cache write failed: {e}")
+    
+    # Reassemble in chunk order (duplicate chunks share one encoded row)
+    if encoded is not None:
+        dimension = encoded.shape[1]
+    elif found:
+        dimension = next(iter(found.values())).shape[0]
+    else:
+        dimension = get_embedding_model().get_sentence_embedding_dimension()
+    embeddings = np.empty((len(chunks), dimension), dtype='float32')
+    miss_rows = {digest: row for row, digest in enumerate(misses)}
+    for i, digest in enumerate(digests):
+        embeddings[i] = found[i] if i in found else encoded[miss_rows[digest]]
+    
+    stats = {
+        "chunks": len(chunks),
+        "cache_hits": len(found),
+        "encoded": len(misses),
+        "hit_ratio": round(len(found) / len(chunks), 4) if chunks else 0.0
+    }
+    return embeddings, stats
+
 def create_embeddings(chunks: List[str]) -> np.ndarray:
     """Convert text chunks to vector embeddings"""
+    embeddings, _ = create_embeddings_with_stats(chunks)
+    return embeddings
+
+def normalize_query(query: str) -> str:
+    """Normalize question text for cache keys: lowercase, single spaces, no trailing ?!.
+    
+    Operators and symbols are kept: "3/4" and "3*4" are different questions.
+    """
+    text = " ".join(query.lower().split())
+    return re.sub(r"[?!.\s]+$", "", text)
+
+def encode_query(query: str) -> np.ndarray:
+    """Get L2-normalized (1, d) query embedding, served from the query cache when possible"""
+    faiss = get_faiss()
+    key = normalize_query(query)
+    
+    cached = _query_embedding_cache.get(key)
+    if cached is not None:
+        # Callers may normalize/modify in place, never hand out the cached array
+        return cached.copy()
+    
+    # Encode the normalized text so every query sharing a key gets the same vector
     model = get_embedding_model()
+    query_embedding = model.encode([key or query]).astype('float32')
+    faiss.normalize_L2(query_embedding)
     
-    print(f"Creating embeddings for {len(chunks)} chunks...")
-    embeddings = model.encode(chunks, show_progress_bar=True)
+    _query_embedding_cache.put(key, query_embedding, size=query_embedding.nbytes)
+    return query_embedding.copy()
+
+def _encode_query_batch(texts: List[str]) -> np.ndarray:
+    """Encode a batch of (already normalized) query texts"""
+    model = get_embedding_model()
+    return model.encode(texts, batch_size=len(texts)).astype('float32')
+
+def get_query_batcher() -> EmbeddingBatcher:
+    """Get or initialize the micro-batching query encoder"""
+    global _query_batcher
+    if _query_batcher is None:
+        _query_batcher = EmbeddingBatcher(
+            _encode_query_batch,
+            max_batch_size=EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=EMBED_BATCH_MAX_WAIT_MS
+        )
+    return _query_batcher
+
+async def aencode_query(query: str) -> np.ndarray:
+    """Async encode_query: cache misses are batched with other concurrent queries"""
+    faiss = get_faiss()
+    key = normalize_query(query)
+    
+    cached = _query_embedding_cache.get(key)
+    if cached is not None:
+        return cached.copy()
+    
+    embedding = await get_query_batcher().encode(key or query)
+    query_embedding = np.asarray(embedding, dtype='float32').reshape(1, -1)
+    faiss.normalize_L2(query_embedding)
+    
+    _query_embedding_cache.put(key, query_embedding, size=query_embedding.nbytes)
+    return query_embedding.copy()
+
+def encode_queries(queries: List[str]) -> np.ndarray:
+    """L2-normalized (Q, d) embeddings of several queries; cache misses are encoded in one batch"""
+    faiss = get_faiss()
+    keys = [normalize_query(query) for query in queries]
     
-    return embeddings.astype('float32')
+    rows = [None] * len(queries)
+    misses = {}  # cache key -> positions
+    for i, key in enumerate(keys):
+        cached = _query_embedding_cache.get(key)
+        if cached is not None:
+            rows[i] = cached[0]
+        else:
+            misses.setdefault(key, []).append(i)
+    
+    if misses:
+        texts = [key or queries[positions[0]] for key, positions in misses.items()]
+        encoded = get_embedding_model().encode(texts, batch_size=len(texts)).astype('float32')
+        faiss.normalize_L2(encoded)
+        for (key, positions), embedding in zip(misses.items(), encoded):
+            query_embedding = embedding.reshape(1, -1).copy()
+            _query_embedding_cache.put(key, query_embedding, size=query_embedding.nbytes)
+            for i in positions:
+                rows[i] = embedding
+    
+    return np.vstack(rows).astype('float32')
+
+async def aencode_queries(queries: List[str]) -> np.ndarray:
+    """Async encode_queries: concurrent misses land in the same micro-batch"""
+    embeddings = await asyncio.gather(*(aencode_query(query) for query in queries))
+    return np.vstack(embeddings)
+
+def get_query_batcher_stats() -> dict:
+    """Batch-size and queue-wait histograms of the query encoder"""
+    return get_query_batcher().stats()
 
-def create_faiss_index(embeddings: np.ndarray) -> faiss.Index:
-    """Create FAISS index from embeddings"""
+def get_query_cache_stats() -> dict:
+    """Hit/miss counters and occupancy of the query-embedding cache"""
+    return _query_embedding_cache.stats()
+
+def create_faiss_index(embeddings: np.ndarray, index_type: Optional[str] = None, compression: Optional[str] = None) -> faiss.Index:
+    """Create FAISS index from embeddings
+    
+    Exact for small textbooks, ANN above ANN_MIN_VECTORS; vectors are optionally
+    compressed (sq8 / fp16 / pq) per INDEX_COMPRESSION.
+    """
+    faiss = get_faiss()
     print(f"Creating FAISS index with {embeddings.shape[0]} vectors...")
     
     dimension = embeddings.shape[1]  # Usually 384 for all-MiniLM-L6-v2
+    index_type = resolve_index_type(embeddings.shape[0], index_type)
+    compression = resolve_compression(embeddings.shape[0], compression, index_type)
     
-    # Use IndexFlatIP for cosine similarity (Inner Product after normalization)
-    index = faiss.IndexFlatIP(dimension)
-    
-    # Normalize embeddings for cosine similarity
+    # Normalize embeddings for cosine similarity (Inner Product after normalization)
     faiss.normalize_L2(embeddings)
     
-    # Add vectors to index
-    index.add(embeddings)
+    if index_type == "flat" and compression == "none":
+        index = build_index("flat", embeddings)
+    else:
+        # Approximate/compressed indexes must stay close to exact search: step down to
+        # the next larger codec (pq -> sq8 -> fp16 -> none), and to flat as a last resort
+        for codec in compression_fallbacks(compression):
+            if index_type == "flat" and codec == "none":
+                index = build_index("flat", embeddings)
+                break
+            index = build_index(index_type, embeddings, codec)
+            recall = measure_recall(index, embeddings)
+            print(f"{describe_index_type(index)} recall@10 vs flat index: {recall:.3f}")
+            if recall >= ANN_MIN_RECALL:
+                break
+            print(f"⚠️ Recall below {ANN_MIN_RECALL} with {codec} compression")
+        else:
+            print("⚠️ Falling back to flat index")
+            index = build_index("flat", embeddings)
     
-    print(f"FAISS index created with dimension {dimension}")
+    print(f"FAISS {describe_index_type(index)} index created with dimension {dimension}")
     return index
 
-def save_textbook_vectors(user_email: str, textbook_id: str, index: faiss.Index, chunks: List[str]):
-    """Save FAISS index and chunk mapping"""
-    
-    # Create directories
-    os.makedirs("data/indexes", exist_ok=True)
-    os.makedirs("data/chunks", exist_ok=True)
-    
-    # Create safe filename for this textbook
+def _legacy_vector_paths(user_email: str, textbook_id: str) -> Tuple[str, str]:
+    """(index_path, chunks_path) of vectors stored before versioned snapshots"""
     safe_email = user_email.replace("@", "_").replace(".", "_")
     safe_filename = f"{safe_email}_{textbook_id}"
     
-    # Save FAISS index
-    index_path = f"data/indexes/{safe_filename}.index"
-    faiss.write_index(index, index_path)
+    return f"data/indexes/{safe_filename}.index", f"data/chunks/{safe_filename}.chunks"
+
+def _chunk_ids_path(chunks_path: str) -> str:
+    """Stable chunk ids (one UUID per chunk store row)"""
+    return chunks_path[:-len(".chunks")] + ".ids"
+
+def _lexical_index_path(chunks_path: str) -> str:
+    """BM25 inverted index over the chunk store rows"""
+    return chunks_path[:-len(".chunks")] + ".bm25"
+
+def _legacy_chunks_path(chunks_path: str) -> str:
+    """Pickled chunk list written before the columnar chunk store"""
+    return chunks_path[:-len(".chunks")] + ".pkl"
+
+def migrate_legacy_chunks(chunks_path: str) -> bool:
+    """Convert a legacy .pkl chunk list to the chunk store format; returns True if migrated"""
+    legacy_path = _legacy_chunks_path(chunks_path)
+    if os.path.exists(chunks_path) or not os.path.exists(legacy_path):
+        return False
+    
+    with open(legacy_path, 'rb') as f:
+        chunks = pickle.load(f)
+    
+    # Legacy files only kept the text; page numbers are unknown (0)
+    write_chunk_store(chunks_path, chunks)
+    os.remove(legacy_path)
+    print(f"Migrated chunks: {legacy_path} -> {chunks_path}")
+    return True
+
+def _snapshot_manifest(index: faiss.Index, chunk_count: int, **extra) -> dict:
+    """Manifest fields describing a snapshot's contents and the model its vectors came from"""
+    return dict(
+        model=EMBEDDING_MODEL_NAME,
+        embedding_backend=EMBEDDING_BACKEND,
+        vector_count=int(index.ntotal),
+        dimension=int(index.d),
+        index_type=describe_index_type(index),
+        compression=index_compression(index),
+        chunk_count=chunk_count,
+        **extra
+    )
+
+def migrate_legacy_vectors(user_email: str, textbook_id: str) -> Optional[Snapshot]:
+    """Publish vectors stored in the flat pre-snapshot layout as the textbook's first snapshot"""
+    faiss = get_faiss()
+    index_path, chunks_path = _legacy_vector_paths(user_email, textbook_id)
+    migrate_legacy_chunks(chunks_path)
+    if not os.path.exists(index_path) or not os.path.exists(chunks_path):
+        return None
+    
+    root = get_snapshot_root(user_email, textbook_id)
+    os.makedirs(root, exist_ok=True)
+    staging = begin_snapshot(root)
+    try:
+        shutil.copyfile(index_path, os.path.join(staging, INDEX_FILE))
+        shutil.copyfile(chunks_path, os.path.join(staging, CHUNKS_FILE))
+        if os.path.exists(_chunk_ids_path(chunks_path)):
+            shutil.copyfile(_chunk_ids_path(chunks_path), os.path.join(staging, IDS_FILE))
+        
+        chunks = ChunkStore(os.path.join(staging, CHUNKS_FILE))
+        try:
+            chunk_count = len(chunks)
+            if os.path.exists(_lexical_index_path(chunks_path)):
+                shutil.copyfile(_lexical_index_path(chunks_path), os.path.join(staging, LEXICAL_FILE))
+            else:
+                LexicalIndex.build(list(chunks)).save(os.path.join(staging, LEXICAL_FILE))
+        finally:
+            chunks.close()
+        
+        # Legacy vectors were embedded with whatever model was configured at the time
+        index = faiss.read_index(index_path)
+        snapshot = publish_snapshot(root, staging, _snapshot_manifest(index, chunk_count, migrated=True))
+    except Exception:
+        abort_snapshot(staging)
+        raise
+    
+    for path in (index_path, chunks_path, _chunk_ids_path(chunks_path), _lexical_index_path(chunks_path)):
+        if os.path.exists(path):
+            os.remove(path)
+    print(f"Migrated vectors: {index_path} -> {snapshot.path}")
+    return snapshot
+
+def _current_snapshot(user_email: str, textbook_id: str) -> Optional[Snapshot]:
+    """A textbook's published snapshot, migrating legacy flat files on first access"""
+    root = get_snapshot_root(user_email, textbook_id)
+    snapshot = open_snapshot(root)
+    if snapshot is None:
+        try:
+            snapshot = migrate_legacy_vectors(user_email, textbook_id)
+        except Exception as e:
+            print(f"Vector migration failed for {textbook_id}: {e}")
+            # Another worker may have migrated it concurrently
+            snapshot = open_snapshot(root)
+    return snapshot
+
+def _file_signature(*paths: str) -> tuple:
+    """mtime/size signature used to detect vector files replaced on disk (None for missing files)"""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def _estimate_vectors_size(index_path: str, chunk_bytes: int = 0, mapped: bool = False) -> int:
+    """Approximate heap footprint of a loaded index plus any in-heap chunk texts"""
+    # Serialized size tracks compression; memory-mapped vectors live in the shared
+    # page cache, not in this process's heap
+    index_bytes = 0 if mapped else os.path.getsize(index_path)
+    return index_bytes + chunk_bytes
+
+def _read_snapshot(snapshot: Snapshot, delta_path: str) -> TextbookVectors:
+    """Load a snapshot's files and replay the pending delta; raises SnapshotError if inconsistent"""
+    manifest = snapshot.manifest
+    if SNAPSHOT_VERIFY_CHECKSUMS and not verify_snapshot(snapshot):
+        raise SnapshotError(f"checksum mismatch in {snapshot.path}")
     
-    # Save chunk text mapping
-    chunks_path = f"data/chunks/{safe_filename}.pkl"
-    with open(chunks_path, 'wb') as f:
-        pickle.dump(chunks, f)
+    expected_key = embedding_cache_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+    snapshot_key = embedding_cache_key(manifest["model"], manifest["embedding_backend"])
+    if snapshot_key != expected_key:
+        print(f"⚠️ {snapshot.path} was embedded with {snapshot_key}, queries use {expected_key}; re-index it")
     
-    print(f"Vectors saved: {index_path}")
-    print(f"Chunks saved: {chunks_path}")
+    # Load FAISS index (read-only mmap when INDEX_LOAD_MODE=mmap)
+    try:
+        index = read_index(snapshot.file(INDEX_FILE))
+    except RuntimeError:
+        # FAISS reports a missing file as RuntimeError; callers retry on FileNotFoundError
+        if not os.path.exists(snapshot.file(INDEX_FILE)):
+            raise FileNotFoundError(snapshot.file(INDEX_FILE))
+        raise
+    
+    # Map chunks (texts stay in the page cache, only looked-up rows are read)
+    chunks = ChunkStore(snapshot.file(CHUNKS_FILE))
+    
+    if index.ntotal != manifest["vector_count"] or len(chunks) != manifest["chunk_count"]:
+        raise SnapshotError(
+            f"{snapshot.path} holds {index.ntotal} vectors / {len(chunks)} chunks, "
+            f"manifest says {manifest['vector_count']} / {manifest['chunk_count']}"
+        )
+    
+    chunk_ids = None
+    if snapshot.has_file(IDS_FILE):
+        with open(snapshot.file(IDS_FILE)) as f:
+            chunk_ids = f.read().split()
+    
+    # Replay pending incremental updates
+    delta = vector_delta.read_delta(delta_path, index.d)
+    
+    lexical = None
+    try:
+        lexical = LexicalIndex.load(snapshot.file(LEXICAL_FILE))
+    except Exception as e:
+        print(f"Lexical index unavailable for {snapshot.path}: {e}")
     
-    return index_path, chunks_path
+    return TextbookVectors(index, chunks, chunk_ids, delta, lexical)
 
-def process_chunks_to_vectors(user_email: str, textbook_id: str, chunks: List[dict]) -> Tuple[str, str]:
-    """Complete pipeline: chunks -> embeddings -> FAISS index -> save"""
+def load_textbook_vectors(user_email: str, textbook_id: str) -> Optional[TextbookVectors]:
+    """Load a textbook's current snapshot (+ delta), served from the LRU cache while it is unchanged
+    
+    A newly published snapshot is picked up by the next call; searches still holding
+    the previously loaded vectors finish on them.
+    """
+    key = (user_email, textbook_id)
+    delta_path = vector_delta.get_delta_path(user_email, textbook_id)
+    
+    # Cache hits only read the CURRENT pointer and stat the delta, not the manifest
+    cached = _vector_cache.get(key)
+    if cached is not None:
+        version = current_version(get_snapshot_root(user_email, textbook_id))
+        if cached["signature"] == (version, _file_signature(delta_path)):
+            return cached["vectors"]
+        # A new snapshot was published or the delta changed since we cached it
+        _vector_cache.invalidate(key)
+    
+    snapshot = _current_snapshot(user_email, textbook_id)
+    if snapshot is None:
+        print(f"Vector files not found for {textbook_id}")
+        return None
+    signature = (snapshot.version, _file_signature(delta_path))
+    
+    try:
+        vectors = _read_snapshot(snapshot, delta_path)
+    except FileNotFoundError:
+        # Our version was collected after newer ones were published; load the current one
+        if current_version(get_snapshot_root(user_email, textbook_id)) != snapshot.version:
+            return load_textbook_vectors(user_email, textbook_id)
+        raise
+    except SnapshotError as e:
+        print(f"❌ Refusing to load vectors: {e}")
+        return None
+    
+    _vector_cache.put(
+        key,
+        {"vectors": vectors, "signature": signature},
+        size=_estimate_vectors_size(
+            snapshot.file(INDEX_FILE),
+            chunk_bytes=vectors.lexical.nbytes if vectors.lexical else 0,
+            mapped=INDEX_LOAD_MODE == "mmap"
+        )
+    )
+    
+    return vectors
+
+def get_textbook_version(user_email: str, textbook_id: str) -> tuple:
+    """Published snapshot version plus delta signature; changes whenever a textbook is re-indexed or updated"""
+    return (
+        current_version(get_snapshot_root(user_email, textbook_id)),
+        _file_signature(vector_delta.get_delta_path(user_email, textbook_id))
+    )
+
+def invalidate_textbook_vectors(user_email: str, textbook_id: str) -> bool:
+    """Drop a textbook's loaded vectors from the in-memory cache"""
+    return _vector_cache.invalidate((user_email, textbook_id))
+
+def get_vector_cache_stats() -> dict:
+    """Hit/miss counters and occupancy of the loaded-vectors cache"""
+    return _vector_cache.stats()
+
+def save_textbook_vectors(
+    user_email: str,
+    textbook_id: str,
+    index: faiss.Index,
+    chunks: List[str],
+    page_numbers: Optional[List[int]] = None,
+    chunk_numbers: Optional[List[int]] = None,
+    chunk_ids: Optional[List[str]] = None,
+    activate: bool = True
+):
+    """Publish FAISS index, chunk store, BM25 index and (optionally) stable chunk ids as a new snapshot
+    
+    With activate=False the snapshot is written next to the current one without
+    being served (see activate_textbook_vectors). Returns the (index_path,
+    chunks_path) inside the new snapshot.
+    """
+    faiss = get_faiss()
+    
+    root = get_snapshot_root(user_email, textbook_id)
+    os.makedirs(root, exist_ok=True)
+    
+    # Everything is written to a private staging directory; readers only ever see
+    # complete snapshots, switched to by publish_snapshot's atomic renames
+    staging = begin_snapshot(root)
+    try:
+        faiss.write_index(index, os.path.join(staging, INDEX_FILE))
+        
+        # Chunk texts with their page/chunk numbers
+        write_chunk_store(os.path.join(staging, CHUNKS_FILE), chunks, page_numbers, chunk_numbers)
+        
+        # BM25 index over the same rows
+        LexicalIndex.build(chunks).save(os.path.join(staging, LEXICAL_FILE))
+        
+        # Chunk ids (needed to update single chunks incrementally)
+        if chunk_ids is not None:
+            with open(os.path.join(staging, IDS_FILE), "w") as f:
+                f.write("\n".join(chunk_ids))
+        
+        snapshot = publish_snapshot(root, staging, _snapshot_manifest(index, len(chunks)), activate=activate)
+    except Exception:
+        abort_snapshot(staging)
+        raise
+    
+    print(f"Vectors {'published' if activate else 'written (inactive)'}: {snapshot.path} ({index.ntotal} vectors)")
+    
+    return snapshot.file(INDEX_FILE), snapshot.file(CHUNKS_FILE)
+
+def process_chunks_to_vectors(
+    user_email: str,
+    textbook_id: str,
+    chunks: List[dict],
+    subject: Optional[str] = None,
+    chunk_ids: Optional[List[str]] = None,
+    index_type: Optional[str] = None,
+    compression: Optional[str] = None,
+    activate: bool = True
+) -> Tuple[str, str, dict]:
+    """Complete pipeline: chunks -> embeddings -> FAISS index -> save (+ user's library index)
+    
+    chunk_ids are the chunks' database ids; they enable incremental updates later.
+    With activate=False the new snapshot is only written; it is served, and added
+    to the library index, by activate_textbook_vectors.
+    Returns (index_path, chunks_path, embedding cache stats).
+    """
     
     # Extract just the text content from chunks
     chunk_texts = [chunk["content"] for chunk in chunks]
     
     print(f"Processing {len(chunk_texts)} chunks to vectors...")
     
-    # Create embeddings
-    embeddings = create_embeddings(chunk_texts)
+    # Create embeddings (previously seen chunk texts come from the embedding cache)
+    embeddings, embedding_stats = create_embeddings_with_stats(chunk_texts)
     
     # Create FAISS index
-    index = create_faiss_index(embeddings)
+    index = create_faiss_index(embeddings, index_type, compression)
     
     # Save everything
-    index_path, chunks_path = save_textbook_vectors(user_email, textbook_id, index, chunk_texts)
+    index_path, chunks_path = save_textbook_vectors(
+        user_email, textbook_id, index, chunk_texts,
+        page_numbers=[chunk.get("page_number", 1) for chunk in chunks],
+        chunk_numbers=[chunk.get("chunk_number", i + 1) for i, chunk in enumerate(chunks)],
+        chunk_ids=chunk_ids,
+        activate=activate
+    )
+    if not activate:
+        return index_path, chunks_path, embedding_stats
+    
+    # A full rebuild supersedes any pending incremental updates
+    delta_path = vector_delta.get_delta_path(user_email, textbook_id)
+    with textbook_delta_lock(user_email, textbook_id):
+        if os.path.exists(delta_path):
+            os.remove(delta_path)
+        invalidate_textbook_vectors(user_email, textbook_id)
+    answer_cache.invalidate_textbook((user_email, textbook_id))
+    
+    # Add the (now normalized) embeddings to the user's cross-textbook index
+    try:
+        add_to_user_library(user_email, textbook_id, embeddings, chunks, subject)
+    except Exception as e:
+        print(f"Library index update failed: {e}")
+    
+    return index_path, chunks_path, embedding_stats
+
+def activate_textbook_vectors(user_email: str, textbook_id: str, version: str, subject: Optional[str] = None) -> bool:
+    """Serve a snapshot written with activate=False; returns False if it is already current"""
+    root = get_snapshot_root(user_email, textbook_id)
+    current = current_version(root)
+    if current == version:
+        return False
+    if current is not None and int(current[1:]) > int(version[1:]):
+        print(f"⚠️ {textbook_id} was re-indexed as {current} after {version} was written; not activating it")
+        return False
+    
+    snapshot = open_snapshot(root, version)
+    if snapshot is None:
+        raise SnapshotError(f"no snapshot {version} for {textbook_id}")
+    activate_version(root, version)
+    
+    # The snapshot was built from the full chunk list; pending updates are superseded
+    delta_path = vector_delta.get_delta_path(user_email, textbook_id)
+    with textbook_delta_lock(user_email, textbook_id):
+        if os.path.exists(delta_path):
+            os.remove(delta_path)
+        invalidate_textbook_vectors(user_email, textbook_id)
+    answer_cache.invalidate_textbook((user_email, textbook_id))
+    
+    # The library index needs the new embeddings too (served by the embedding cache)
+    chunks = ChunkStore(snapshot.file(CHUNKS_FILE))
+    try:
+        library_chunks = [
+            {"content": chunks[row], "page_number": chunks.page_number(row), "chunk_number": chunks.chunk_number(row)}
+            for row in range(len(chunks))
+        ]
+    finally:
+        chunks.close()
+    embeddings = create_embeddings([chunk["content"] for chunk in library_chunks])
+    get_faiss().normalize_L2(embeddings)
+    try:
+        add_to_user_library(user_email, textbook_id, embeddings, library_chunks, subject)
+    except Exception as e:
+        print(f"Library index update failed: {e}")
+    
+    print(f"Activated {textbook_id} vectors {version}")
+    return True
+
+# INCREMENTAL UPDATES
+
+def _get_textbook_lock(user_email: str, textbook_id: str) -> threading.Lock:
+    with _textbook_locks_guard:
+        key = (user_email, textbook_id)
+        if key not in _textbook_locks:
+            _textbook_locks[key] = threading.Lock()
+        return _textbook_locks[key]
+
+@contextmanager
+def textbook_delta_lock(user_email: str, textbook_id: str):
+    """Serializes delta appends, compaction and delta removal for one textbook, also across processes"""
+    delta_path = vector_delta.get_delta_path(user_email, textbook_id)
+    with _get_textbook_lock(user_email, textbook_id):
+        os.makedirs(os.path.dirname(delta_path), exist_ok=True)
+        with open(f"{delta_path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _upsert_delta_chunks(user_email: str, textbook_id: str, chunks: List[dict]) -> int:
+    """Add or replace chunks (each with a "chunk_id") in the vectors only, via the delta log"""
+    faiss = get_faiss()
+    if not chunks:
+        return 0
     
-    return index_path, chunks_path
+    texts = [chunk["content"] for chunk in chunks]
+    embeddings = create_embeddings(texts)
+    faiss.normalize_L2(embeddings)
+    
+    records = [
+        vector_delta.upsert_record(
+            chunk["chunk_id"], chunk["content"], embedding,
+            page_number=chunk.get("page_number", 1),
+            chunk_number=chunk.get("chunk_number", 0)
+        )
+        for chunk, embedding in zip(chunks, embeddings)
+    ]
+    
+    with textbook_delta_lock(user_email, textbook_id):
+        vector_delta.append_records(vector_delta.get_delta_path(user_email, textbook_id), records)
+        invalidate_textbook_vectors(user_email, textbook_id)
+    
+    print(f"Upserted {len(records)} chunks into {textbook_id} delta")
+    _maybe_schedule_compaction(user_email, textbook_id)
+    return len(records)
+
+def _remove_delta_chunks(user_email: str, textbook_id: str, chunk_ids: List[str]) -> int:
+    """Remove chunks by id from the vectors only, via the delta log"""
+    if not chunk_ids:
+        return 0
+    
+    records = [vector_delta.remove_record(chunk_id) for chunk_id in chunk_ids]
+    
+    with textbook_delta_lock(user_email, textbook_id):
+        vector_delta.append_records(vector_delta.get_delta_path(user_email, textbook_id), records)
+        invalidate_textbook_vectors(user_email, textbook_id)
+    
+    print(f"Removed {len(records)} chunks from {textbook_id}")
+    _maybe_schedule_compaction(user_email, textbook_id)
+    return len(records)
 
-def search_similar_chunks(user_email: str, textbook_id: str, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
-    """Search for similar chunks in student's textbook"""
+async def aupsert_textbook_chunks(user_email: str, textbook_id: str, chunks: List[dict]) -> int:
+    """Add or replace individual chunks (each with a "chunk_id") without rebuilding the index
+    
+    The chunks are written to textbook_chunks first: full rebuilds (re-index,
+    activation) read the database and drop the delta log.
+    """
+    from app.models.chunk_model import upsert_chunk_documents
+    
+    if not chunks:
+        return 0
+    await upsert_chunk_documents(textbook_id, user_email, chunks)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(_upsert_delta_chunks, user_email, textbook_id, chunks))
+
+async def aremove_textbook_chunks(user_email: str, textbook_id: str, chunk_ids: List[str]) -> int:
+    """Remove individual chunks by id, from textbook_chunks and the vectors, without rebuilding the index"""
+    from app.models.chunk_model import delete_chunk_documents
+    
+    if not chunk_ids:
+        return 0
+    await delete_chunk_documents(textbook_id, user_email, chunk_ids)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(_remove_delta_chunks, user_email, textbook_id, chunk_ids))
+
+def _maybe_schedule_compaction(user_email: str, textbook_id: str):
+    """Compact in the background once the delta log has grown past DELTA_COMPACT_RECORDS"""
+    vectors = load_textbook_vectors(user_email, textbook_id)
+    if vectors is None or vectors.delta is None or vectors.delta.record_count < DELTA_COMPACT_RECORDS:
+        return
+    
+    key = (user_email, textbook_id)
+    with _textbook_locks_guard:
+        if key in _compactions_pending:
+            return
+        _compactions_pending.add(key)
+    
+    def run():
+        try:
+            compact_textbook_vectors(user_email, textbook_id)
+        except Exception as e:
+            print(f"Compaction failed for {textbook_id}: {e}")
+        finally:
+            with _textbook_locks_guard:
+                _compactions_pending.discard(key)
+    
+    _compaction_executor.submit(run)
+
+def compact_textbook_vectors(user_email: str, textbook_id: str) -> bool:
+    """Fold a textbook's delta log into a freshly built base index; returns True if compacted"""
+    with textbook_delta_lock(user_email, textbook_id):
+        invalidate_textbook_vectors(user_email, textbook_id)
+        vectors = load_textbook_vectors(user_email, textbook_id)
+        if vectors is None or vectors.delta is None:
+            return False
+        
+        if vectors.chunk_ids is None:
+            print(f"⚠️ {textbook_id} has no chunk ids; re-index it to apply incremental updates")
+            return False
+        
+        delta = vectors.delta
+        chunks = [
+            {
+                "chunk_id": chunk_id,
+                "content": vectors.chunks[row],
+                "page_number": vectors.chunks.page_number(row),
+                "chunk_number": vectors.chunks.chunk_number(row)
+            }
+            for row, chunk_id in enumerate(vectors.chunk_ids)
+            if chunk_id not in delta.removed
+        ]
+        chunks.extend(delta.live_chunks())
+        chunks.sort(key=lambda chunk: (chunk["page_number"], chunk["chunk_number"]))
+        
+        print(f"Compacting {textbook_id}: {len(chunks)} chunks ({delta.record_count} delta records)")
+        
+        # Unchanged chunks come straight from the embedding cache
+        embeddings = create_embeddings([chunk["content"] for chunk in chunks])
+        index = create_faiss_index(embeddings)
+        
+        save_textbook_vectors(
+            user_email, textbook_id, index, [chunk["content"] for chunk in chunks],
+            page_numbers=[chunk["page_number"] for chunk in chunks],
+            chunk_numbers=[chunk["chunk_number"] for chunk in chunks],
+            chunk_ids=[chunk["chunk_id"] for chunk in chunks]
+        )
+        os.remove(vector_delta.get_delta_path(user_email, textbook_id))
+        invalidate_textbook_vectors(user_email, textbook_id)
+    
     try:
-        # Create safe filename
-        safe_email = user_email.replace("@", "_").replace(".", "_")
-        safe_filename = f"{safe_email}_{textbook_id}"
+        add_to_user_library(user_email, textbook_id, embeddings, chunks)
+    except Exception as e:
+        print(f"Library index update failed: {e}")
+    
+    return True
+
+# CROSS-TEXTBOOK (LIBRARY) SEARCH
+
+LIBRARY_CACHE_KEY = "__library__"
+
+def add_to_user_library(user_email: str, textbook_id: str, embeddings: np.ndarray, chunks: List[dict], subject: Optional[str] = None) -> int:
+    """Add or replace a textbook's normalized embeddings in the user's merged index"""
+    with library_index.user_library_lock(user_email):
+        loaded = library_index.read_user_library(user_email)
+        if loaded is not None and loaded[0].d != embeddings.shape[1]:
+            # Embedding model changed: the library is rebuilt as textbooks are re-indexed
+            print(f"Library index for {user_email} has dimension {loaded[0].d}, starting a new one")
+            loaded = None
+        index, meta = loaded if loaded else library_index.new_user_library(embeddings.shape[1])
         
-        # Load index and chunks
-        index_path = f"data/indexes/{safe_filename}.index"
-        chunks_path = f"data/chunks/{safe_filename}.pkl"
+        added = library_index.add_textbook(index, meta, textbook_id, embeddings, chunks, subject)
+        library_index.write_user_library(user_email, index, meta)
+        _vector_cache.invalidate((user_email, LIBRARY_CACHE_KEY))
+    
+    print(f"Library index for {user_email}: +{added} vectors ({index.ntotal} total)")
+    return added
+
+def remove_from_user_library(user_email: str, textbook_id: str) -> int:
+    """Remove a textbook from the user's merged index"""
+    with library_index.user_library_lock(user_email):
+        loaded = library_index.read_user_library(user_email)
+        if loaded is None:
+            return 0
+        index, meta = loaded
         
-        if not os.path.exists(index_path) or not os.path.exists(chunks_path):
-            print(f"Vector files not found for {safe_filename}")
+        removed = library_index.remove_textbook(index, meta, textbook_id)
+        if removed:
+            library_index.write_user_library(user_email, index, meta)
+            _vector_cache.invalidate((user_email, LIBRARY_CACHE_KEY))
+    
+    return removed
+
+def load_user_library(user_email: str) -> Optional[Tuple[faiss.Index, dict]]:
+    """Load the user's merged index, served from the LRU cache when files are unchanged"""
+    index_path, meta_path = library_index.get_user_library_paths(user_email)
+    
+    if not os.path.exists(index_path) or not os.path.exists(meta_path):
+        return None
+    
+    key = (user_email, LIBRARY_CACHE_KEY)
+    signature = _file_signature(index_path, meta_path)
+    
+    cached = _vector_cache.get(key)
+    if cached is not None:
+        if cached["signature"] == signature:
+            return cached["index"], cached["meta"]
+        _vector_cache.invalidate(key)
+    
+    index, meta = library_index.read_user_library(user_email)
+    text_bytes = sum(len(entry["content"]) for entry in meta["entries"].values())
+    
+    _vector_cache.put(
+        key,
+        {"index": index, "meta": meta, "signature": signature},
+        size=_estimate_vectors_size(index_path, text_bytes)
+    )
+    
+    return index, meta
+
+def search_user_library(
+    user_email: str,
+    query: str,
+    top_k: int = 5,
+    subject: Optional[str] = None,
+    query_embedding: Optional[np.ndarray] = None
+) -> List[dict]:
+    """Search across all of a user's textbooks (optionally one subject) in one index query"""
+    try:
+        loaded = load_user_library(user_email)
+        if loaded is None:
             return []
+        index, meta = loaded
         
-        # Load FAISS index
-        index = faiss.read_index(index_path)
-        
-        # Load chunks
-        with open(chunks_path, 'rb') as f:
-            chunks = pickle.load(f)
+        if query_embedding is None:
+            query_embedding = encode_query(query)
         
-        # Create query embedding
-        model = get_embedding_model()
-        query_embedding = model.encode([query]).astype('float32')
-        faiss.normalize_L2(query_embedding)
+        return library_index.search_library(index, meta, query_embedding, top_k=top_k, subject=subject)
         
-        # Search
-        scores, indices = index.search(query_embedding, top_k)
+    except Exception as e:
+        print(f"Library search error: {e}")
+        return []
+
+def search_similar_chunks(
+    user_email: str,
+    textbook_id: str,
+    query: str,
+    top_k: int = 5,
+    query_embedding: Optional[np.ndarray] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None
+) -> List[Tuple[str, float]]:
+    """Search for similar chunks in student's textbook
+    
+    Pass query_embedding to skip encoding; nprobe / ef_search tune IVF / HNSW indexes.
+    """
+    try:
+        # Load index and chunks (cached across calls)
+        vectors = load_textbook_vectors(user_email, textbook_id)
+        if vectors is None:
+            return []
         
-        # Return results
-        results = []
-        for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-            if idx < len(chunks) and score > 0.3:  # Minimum similarity threshold
-                results.append((chunks[idx], float(score)))
+        # Create query embedding (cached by normalized question text)
+        if query_embedding is None:
+            query_embedding = encode_query(query)
         
-        return results
+        params = get_search_params(vectors.index, nprobe=nprobe, ef_search=ef_search)
+        return _search_textbook_vectors(vectors, query_embedding, top_k, params)
         
     except Exception as e:
         print(f"Search error: {e}")
         return []
 
-def get_textbook_vector_info(user_email: str, textbook_id: str) -> dict:
-    """Get info about stored vectors for a textbook"""
-    safe_email = user_email.replace("@", "_").replace(".", "_")
-    safe_filename = f"{safe_email}_{textbook_id}"
+def _vector_candidates(vectors: TextbookVectors, query_embeddings: np.ndarray, top_k: int, params=None) -> List[List[Tuple[float, object, Optional[str]]]]:
+    """Best-first (score, key, delta content) per query row, from base index and pending delta
+    
+    All queries go through one index.search call with the (Q, d) matrix. key is the
+    chunk store row for base chunks and the chunk id for delta chunks.
+    """
+    index, chunks, chunk_ids, delta = vectors.index, vectors.chunks, vectors.chunk_ids, vectors.delta
+    
+    # Over-fetch from the base so chunks hidden by the delta don't shrink the result
+    base_k = top_k + (len(delta.removed) if delta else 0)
+    if params is not None:
+        scores, indices = index.search(query_embeddings, base_k, params=params)
+    else:
+        scores, indices = index.search(query_embeddings, base_k)
+    
+    delta_hits = delta.search_batch(query_embeddings, top_k) if delta else [[] for _ in range(len(scores))]
+    
+    per_query = []
+    for row_scores, row_indices, row_delta_hits in zip(scores, indices, delta_hits):
+        # ANN indexes pad missing results with -1
+        candidates = []
+        for score, idx in zip(row_scores, row_indices):
+            if not 0 <= idx < len(chunks):
+                continue
+            if delta and chunk_ids and chunk_ids[idx] in delta.removed:
+                continue
+            candidates.append((float(score), int(idx), None))
+        
+        for entry in row_delta_hits:
+            candidates.append((entry["score"], entry["chunk_id"], entry["content"]))
+        
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        per_query.append(candidates[:top_k])
+    
+    return per_query
+
+def _merge_candidates(per_query: List[List[Tuple[float, object, Optional[str]]]]) -> List[Tuple[float, object, Optional[str]]]:
+    """De-duplicated best-first ranking across queries (each chunk keeps its best score)"""
+    best = {}
+    for candidates in per_query:
+        for candidate in candidates:
+            if candidate[1] not in best or candidate[0] > best[candidate[1]][0]:
+                best[candidate[1]] = candidate
+    return sorted(best.values(), key=lambda candidate: candidate[0], reverse=True)
+
+def _candidate_results(vectors: TextbookVectors, candidates, top_k: int) -> List[Tuple[str, float]]:
+    """(text, score) for the top candidates above the minimum similarity threshold"""
+    results = []
+    for score, key, content in candidates[:top_k]:
+        if score > 0.3:  # Minimum similarity threshold
+            results.append((content if content is not None else vectors.chunks[key], score))
+    return results
+
+def _search_textbook_vectors(vectors: TextbookVectors, query_embedding: np.ndarray, top_k: int, params=None) -> List[Tuple[str, float]]:
+    """Search base index and pending delta, merging results by score"""
+    return _candidate_results(vectors, _vector_candidates(vectors, query_embedding, top_k, params)[0], top_k)
+
+def search_similar_chunks_batch(
+    user_email: str,
+    textbook_id: str,
+    queries: List[str],
+    top_k: int = 5,
+    query_embeddings: Optional[np.ndarray] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None
+) -> dict:
+    """Search one textbook for several queries with one batched encode and one index pass
+    
+    Returns {"per_query": [results for each query], "merged": de-duplicated results
+    across all queries, best score first}; results are (chunk_text, score) like
+    search_similar_chunks.
+    """
+    empty = {"per_query": [[] for _ in queries], "merged": []}
+    if not queries:
+        return empty
+    
+    try:
+        vectors = load_textbook_vectors(user_email, textbook_id)
+        if vectors is None:
+            return empty
+        
+        if query_embeddings is None:
+            query_embeddings = encode_queries(queries)
+        
+        params = get_search_params(vectors.index, nprobe=nprobe, ef_search=ef_search)
+        per_query = _vector_candidates(vectors, query_embeddings, top_k, params)
+        return {
+            "per_query": [_candidate_results(vectors, candidates, top_k) for candidates in per_query],
+            "merged": _candidate_results(vectors, _merge_candidates(per_query), top_k)
+        }
+        
+    except Exception as e:
+        print(f"Batch search error: {e}")
+        return empty
+
+def _hybrid_search_textbook_vectors(
+    vectors: TextbookVectors,
+    query_embeddings: np.ndarray,
+    lexical_query: str,
+    top_k: int,
+    params=None
+) -> List[Tuple[str, float]]:
+    """Fuse vector and BM25 rankings with reciprocal rank fusion
+    
+    The vector ranking is the merged ranking of all query rows. A chunk qualifies if
+    it passes the vector similarity threshold or matches the lexical query's terms.
+    Returned scores are cosine similarities (best over the queries) either way, so
+    callers' relevance thresholds keep their meaning.
+    """
+    if vectors.lexical is None:
+        per_query = _vector_candidates(vectors, query_embeddings, top_k, params)
+        return _candidate_results(vectors, _merge_candidates(per_query), top_k)
     
-    index_path = f"data/indexes/{safe_filename}.index"
-    chunks_path = f"data/chunks/{safe_filename}.pkl"
+    candidate_k = top_k * HYBRID_CANDIDATES_PER_RESULT
+    vector_hits = _merge_candidates(_vector_candidates(vectors, query_embeddings, candidate_k, params))
     
+    # Chunks replaced or removed by the delta are skipped in the base BM25 index
+    delta = vectors.delta
+    removed = delta.removed if delta else ()
+    lexical_rankings = [[
+        row for row, _ in vectors.lexical.search(lexical_query, candidate_k)
+        if not (removed and vectors.chunk_ids and vectors.chunk_ids[row] in removed)
+    ]]
+    
+    texts = {key: content for _, key, content in vector_hits if content is not None}
+    
+    # Delta chunks are ranked by their own (small, lazily built) BM25 index
+    if delta and delta.entries:
+        live_chunks = delta.live_chunks()
+        if delta.lexical is None:
+            delta.lexical = LexicalIndex.build([chunk["content"] for chunk in live_chunks])
+        delta_hits = [live_chunks[i] for i, _ in delta.lexical.search(lexical_query, candidate_k)]
+        lexical_rankings.append([chunk["chunk_id"] for chunk in delta_hits])
+        texts.update((chunk["chunk_id"], chunk["content"]) for chunk in delta_hits)
+    
+    scores = {key: score for score, key, _ in vector_hits}
+    eligible = {key for key, score in scores.items() if score > 0.3}
+    eligible.update(key for ranking in lexical_rankings for key in ranking)
+    
+    fused = reciprocal_rank_fusion([[key for _, key, _ in vector_hits]] + lexical_rankings)
+    selected = [key for key, _ in fused if key in eligible][:top_k]
+    
+    for key in selected:
+        if key not in texts:
+            texts[key] = vectors.chunks[key]
+    
+    # Lexical-only hits get their similarity from the vectors stored in the indexes;
+    # where an index cannot reconstruct them (IVF) they keep their RRF rank and score 0
+    unscored = [key for key in selected if key not in scores]
+    if unscored:
+        stored = _stored_vectors(vectors, unscored)
+        if stored:
+            keys = list(stored)
+            embeddings = np.vstack([stored[key] for key in keys])
+            get_faiss().normalize_L2(embeddings)
+            for key, score in zip(keys, (embeddings @ query_embeddings.T).max(axis=1)):
+                scores[key] = float(score)
+    
+    return [(texts[key], scores.get(key, 0.0)) for key in selected]
+
+def _stored_vectors(vectors: TextbookVectors, keys: list) -> Dict[object, np.ndarray]:
+    """Indexed vectors of base rows / delta chunk ids, for the keys whose index can reconstruct them"""
+    stored = {}
+    # Base chunks are keyed by row, delta chunks by their (string) chunk id
+    rows = [key for key in keys if not isinstance(key, str)]
+    if rows:
+        try:
+            for row, vector in zip(rows, vectors.index.reconstruct_batch(np.asarray(rows, dtype='int64'))):
+                stored[row] = vector
+        except RuntimeError:
+            # IVF indexes keep no direct map from row to stored vector
+            pass
+    
+    for key in keys:
+        if isinstance(key, str) and vectors.delta is not None:
+            try:
+                stored[key] = vectors.delta.index.reconstruct(vector_delta.chunk_label(key))
+            except RuntimeError:
+                pass
+    return stored
+
+def hybrid_search_chunks(
+    user_email: str,
+    textbook_id: str,
+    query: str,
+    top_k: int = 5,
+    lexical_query: Optional[str] = None,
+    extra_queries: Optional[List[str]] = None,
+    query_embeddings: Optional[np.ndarray] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None
+) -> List[Tuple[str, float]]:
+    """One vector pass plus one BM25 pass over a textbook, fused by reciprocal rank
+    
+    lexical_query defaults to query; pass an expanded query (e.g. with conversation
+    keywords) to widen the cheap lexical pass. extra_queries are searched together
+    with query in the same batched vector pass; query_embeddings, if given, has one
+    row per query in [query] + extra_queries.
+    """
+    try:
+        vectors = load_textbook_vectors(user_email, textbook_id)
+        if vectors is None:
+            return []
+        
+        if query_embeddings is None:
+            query_embeddings = encode_queries([query] + list(extra_queries or []))
+        
+        params = get_search_params(vectors.index, nprobe=nprobe, ef_search=ef_search)
+        return _hybrid_search_textbook_vectors(vectors, query_embeddings, lexical_query or query, top_k, params)
+        
+    except Exception as e:
+        print(f"Hybrid search error: {e}")
+        return []
+
+def get_retrieval_executor() -> ThreadPoolExecutor:
+    """Get or initialize the bounded executor used for blocking retrieval work"""
+    global _retrieval_executor
+    if _retrieval_executor is None:
+        _retrieval_executor = ThreadPoolExecutor(
+            max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval"
+        )
+    return _retrieval_executor
+
+async def asearch_similar_chunks(
+    user_email: str,
+    textbook_id: str,
+    query: str,
+    top_k: int = 5,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None
+) -> List[Tuple[str, float]]:
+    """Async search_similar_chunks: encoding and FAISS search never block the event loop"""
+    try:
+        query_embedding = await aencode_query(query)
+    except Exception as e:
+        print(f"Query encoding error: {e}")
+        return []
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_retrieval_executor(),
+        partial(
+            search_similar_chunks, user_email, textbook_id, query, top_k,
+            query_embedding=query_embedding, nprobe=nprobe, ef_search=ef_search
+        )
+    )
+
+async def asearch_similar_chunks_batch(
+    user_email: str,
+    textbook_id: str,
+    queries: List[str],
+    top_k: int = 5,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None
+) -> dict:
+    """Async search_similar_chunks_batch, run on the retrieval executor"""
+    try:
+        query_embeddings = await aencode_queries(queries)
+    except Exception as e:
+        print(f"Query encoding error: {e}")
+        return {"per_query": [[] for _ in queries], "merged": []}
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_retrieval_executor(),
+        partial(
+            search_similar_chunks_batch, user_email, textbook_id, queries, top_k,
+            query_embeddings=query_embeddings, nprobe=nprobe, ef_search=ef_search
+        )
+    )
+
+async def ahybrid_search_chunks(
+    user_email: str,
+    textbook_id: str,
+    query: str,
+    top_k: int = 5,
+    lexical_query: Optional[str] = None,
+    extra_queries: Optional[List[str]] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None
+) -> List[Tuple[str, float]]:
+    """Async hybrid_search_chunks, run on the retrieval executor"""
+    try:
+        query_embeddings = await aencode_queries([query] + list(extra_queries or []))
+    except Exception as e:
+        print(f"Query encoding error: {e}")
+        return []
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_retrieval_executor(),
+        partial(
+            hybrid_search_chunks, user_email, textbook_id, query, top_k, lexical_query, extra_queries,
+            query_embeddings=query_embeddings, nprobe=nprobe, ef_search=ef_search
+        )
+    )
+
+async def asearch_user_library(user_email: str, query: str, top_k: int = 5, subject: Optional[str] = None) -> List[dict]:
+    """Async search_user_library, run on the retrieval executor"""
+    try:
+        query_embedding = await aencode_query(query)
+    except Exception as e:
+        print(f"Query encoding error: {e}")
+        return []
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_retrieval_executor(),
+        partial(search_user_library, user_email, query, top_k, subject, query_embedding)
+    )
+
+def get_textbook_vector_info(user_email: str, textbook_id: str) -> dict:
+    """Get info about stored vectors for a textbook (from its snapshot manifest)"""
     info = {
         "has_vectors": False,
         "vector_count": 0,
         "dimension": 0,
-        "index_file_exists": os.path.exists(index_path),
-        "chunks_file_exists": os.path.exists(chunks_path)
+        "index_type": None,
+        "index_file_exists": False,
+        "chunks_file_exists": False
     }
     
     try:
-        if os.path.exists(index_path):
-            index = faiss.read_index(index_path)
-            info["has_vectors"] = True
-            info["vector_count"] = index.ntotal
-            info["dimension"] = index.d
+        snapshot = _current_snapshot(user_email, textbook_id)
+        if snapshot is not None:
+            manifest = snapshot.manifest
+            info.update(
+                has_vectors=True,
+                vector_count=manifest["vector_count"],
+                dimension=manifest["dimension"],
+                index_type=manifest["index_type"],
+                compression=manifest.get("compression"),
+                index_file_exists=os.path.exists(snapshot.file(INDEX_FILE)),
+                chunks_file_exists=os.path.exists(snapshot.file(CHUNKS_FILE)),
+                index_bytes=manifest["files"][INDEX_FILE]["bytes"],
+                snapshot_version=snapshot.version,
+                model=manifest["model"],
+                checksum=manifest["checksum"],
+                created_at=manifest["created_at"]
+            )
     except Exception as e:
         print(f"Error reading vector info: {e}")
     
     return info
 
 def delete_textbook_vectors(user_email: str, textbook_id: str) -> bool:
-    """Delete FAISS index and chunks for a textbook"""
+    """Delete all snapshots and pending updates for a textbook"""
     try:
-        safe_email = user_email.replace("@", "_").replace(".", "_")
-        safe_filename = f"{safe_email}_{textbook_id}"
-        
-        index_path = f"data/indexes/{safe_filename}.index"
-        chunks_path = f"data/chunks/{safe_filename}.pkl"
+        invalidate_textbook_vectors(user_email, textbook_id)
+        answer_cache.invalidate_textbook((user_email, textbook_id))
         
         deleted = False
         
-        # Delete FAISS index file
-        if os.path.exists(index_path):
-            os.remove(index_path)
-            print(f"🗑️ Deleted index: {index_path}")
+        # Drop the textbook from the user's cross-textbook index
+        if remove_from_user_library(user_email, textbook_id):
+            print(f"🗑️ Removed {textbook_id} from library index")
             deleted = True
         
-        # Delete chunks pickle file
-        if os.path.exists(chunks_path):
-            os.remove(chunks_path)
-            print(f"🗑️ Deleted chunks: {chunks_path}")
+        # Delete every snapshot version
+        root = get_snapshot_root(user_email, textbook_id)
+        if remove_snapshots(root):
+            print(f"🗑️ Deleted snapshots: {root}")
             deleted = True
         
+        # Delete the pending delta and any files still in the pre-snapshot layout
+        index_path, chunks_path = _legacy_vector_paths(user_email, textbook_id)
+        delta_path = vector_delta.get_delta_path(user_email, textbook_id)
+        for path in (
+            delta_path, f"{delta_path}.lock", index_path, chunks_path,
+            _chunk_ids_path(chunks_path), _lexical_index_path(chunks_path), _legacy_chunks_path(chunks_path)
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+                print(f"🗑️ Deleted: {path}")
+                deleted = True
+        
         return deleted
         
     except Exception as e:
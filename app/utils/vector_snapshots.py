@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Dict, List, NamedTuple, Optional
+
+# Immutable, versioned per-textbook vector snapshots.
+#
+#   data/vectors/<user>_<textbook>/
+#       CURRENT              name of the published version, e.g. "v000003"
+#       v000003/
+#           manifest.json    vector/chunk counts, model, index type, per-file sha256
+#           vectors.index    FAISS index
+#           chunks.chunks    chunk store
+#           lexical.bm25     BM25 index
+#           chunk.ids        stable chunk ids (optional)
+#
+# A snapshot is written completely into a private staging directory, renamed to
+# its version directory and published by atomically replacing CURRENT. Version
+# directories are never modified afterwards, so a reader that resolved CURRENT
+# always sees a consistent index/chunks pair, and readers holding an older
+# version keep working while new lookups pick up the new one. The current version
+# and the SNAPSHOT_KEEP_VERSIONS - 1 before it are kept (for rollback), as are
+# newer versions written without being activated.
+
+VECTOR_SNAPSHOT_DIR = os.getenv("VECTOR_SNAPSHOT_DIR", "data/vectors")
+SNAPSHOT_KEEP_VERSIONS = max(1, int(os.getenv("SNAPSHOT_KEEP_VERSIONS", "2")))
+# Verify every file's checksum when a snapshot is loaded (reads each file once)
+SNAPSHOT_VERIFY_CHECKSUMS = os.getenv("SNAPSHOT_VERIFY_CHECKSUMS", "0") == "1"
+
+INDEX_FILE = "vectors.index"
+CHUNKS_FILE = "chunks.chunks"
+LEXICAL_FILE = "lexical.bm25"
+IDS_FILE = "chunk.ids"
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+MANIFEST_FORMAT = 1
+_VERSION_RE = re.compile(r"^v(\d{6,})$")
+_STAGING_MAX_AGE_S = 3600
+
+
+class SnapshotError(RuntimeError):
+    """A snapshot is missing, incomplete or fails verification"""
+
+
+class Snapshot(NamedTuple):
+    """A published snapshot version of one textbook's vectors"""
+    version: str
+    path: str
+    manifest: dict
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def has_file(self, name: str) -> bool:
+        return name in self.manifest["files"]
+
+
+def get_snapshot_root(user_email: str, textbook_id: str) -> str:
+    """Directory holding all snapshot versions of a textbook"""
+    safe_email = user_email.replace("@", "_").replace(".", "_")
+    return os.path.join(VECTOR_SNAPSHOT_DIR, f"{safe_email}_{textbook_id}")
+
+
+def current_version(root: str) -> Optional[str]:
+    """Published version name (None if the textbook has no snapshot)"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def open_snapshot(root: str, version: Optional[str] = None) -> Optional[Snapshot]:
+    """The given (default: current) snapshot with its manifest, or None if there is none"""
+    while True:
+        resolved = version or current_version(root)
+        if resolved is None:
+            return None
+
+        path = os.path.join(root, resolved)
+        try:
+            with open(os.path.join(path, MANIFEST_FILE)) as f:
+                return Snapshot(resolved, path, json.load(f))
+        except FileNotFoundError:
+            # The version we resolved was collected after a newer one was published
+            if version is not None or current_version(root) == resolved:
+                return None
+
+
+def list_versions(root: str) -> List[str]:
+    """Version directories, oldest first"""
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return []
+    return sorted((name for name in names if _VERSION_RE.match(name)), key=lambda name: int(name[1:]))
+
+
+def begin_snapshot(root: str) -> str:
+    """Create a private staging directory to write a new snapshot's files into"""
+    staging = os.path.join(root, f".staging-{uuid.uuid4().hex}")
+    os.makedirs(staging)
+    return staging
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def publish_snapshot(root: str, staging: str, manifest: Dict, activate: bool = True) -> Snapshot:
+    """Checksum and seal a staging directory and rename it to the next version
+
+    With activate=False the version is written next to the current one without
+    serving it; activate_version switches to it later.
+    """
+    files = {}
+    for name in sorted(os.listdir(staging)):
+        path = os.path.join(staging, name)
+        _fsync_path(path)
+        files[name] = {"bytes": os.path.getsize(path), "sha256": file_sha256(path)}
+
+    manifest = dict(manifest, format=MANIFEST_FORMAT, created_at=time.time(), files=files)
+    manifest["checksum"] = hashlib.sha256(
+        "".join(f"{name}:{entry['sha256']}\n" for name, entry in files.items()).encode()
+    ).hexdigest()
+
+    with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+    # Concurrent publishers may race for a version number; the rename fails for the loser
+    while True:
+        versions = list_versions(root)
+        version = f"v{(int(versions[-1][1:]) + 1 if versions else 1):06d}"
+        try:
+            os.rename(staging, os.path.join(root, version))
+            break
+        except OSError:
+            if not os.path.isdir(os.path.join(root, version)):
+                raise
+    _fsync_path(root)
+
+    if activate:
+        activate_version(root, version)
+    return Snapshot(version, os.path.join(root, version), manifest)
+
+
+def activate_version(root: str, version: str):
+    """Atomically make a written version the one served to readers"""
+    if not os.path.exists(os.path.join(root, version, MANIFEST_FILE)):
+        raise SnapshotError(f"no snapshot {version} in {root}")
+
+    current_tmp = os.path.join(root, f".{CURRENT_FILE}.{uuid.uuid4().hex}")
+    with open(current_tmp, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+    _fsync_path(root)
+
+    _collect_garbage(root, version)
+
+
+def abort_snapshot(staging: str):
+    """Discard an unpublished staging directory"""
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def verify_snapshot(snapshot: Snapshot) -> bool:
+    """True if every file matches the size and checksum recorded in the manifest"""
+    for name, entry in snapshot.manifest["files"].items():
+        path = snapshot.file(name)
+        if not os.path.exists(path) or os.path.getsize(path) != entry["bytes"]:
+            return False
+        if file_sha256(path) != entry["sha256"]:
+            return False
+    return True
+
+
+def remove_snapshots(root: str) -> bool:
+    """Delete every version of a textbook; returns True if anything was deleted"""
+    if not os.path.isdir(root):
+        return False
+    shutil.rmtree(root, ignore_errors=True)
+    return True
+
+
+def _collect_garbage(root: str, current: str):
+    """Drop versions older than the newest SNAPSHOT_KEEP_VERSIONS and abandoned staging directories"""
+    # Versions newer than the current one are inactive (written for a later switch) and kept
+    versions = [version for version in list_versions(root) if int(version[1:]) < int(current[1:])]
+    for version in versions[:max(0, len(versions) - (SNAPSHOT_KEEP_VERSIONS - 1))]:
+        # Processes still using an old version keep their open files / mappings
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+    for name in os.listdir(root):
+        if name.startswith(".staging-"):
+            path = os.path.join(root, name)
+            try:
+                if time.time() - os.path.getmtime(path) > _STAGING_MAX_AGE_S:
+                    shutil.rmtree(path, ignore_errors=True)
+            except FileNotFoundError:
+                pass
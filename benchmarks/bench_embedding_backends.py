@@ -0,0 +1,100 @@
+"""Embedding backend benchmark: throughput, latency and agreement with PyTorch
+
+Encodes the same synthetic chunk texts with each backend (torch, onnx,
+onnx-int8) and reports batch throughput (texts/s), single-query latency
+p50/p99 and cosine similarity of every backend's vectors with the PyTorch
+backend's (the reference the existing indexes were built with).
+
+The ONNX exports are created under ONNX_MODEL_DIR on first use.
+
+Usage:
+    python benchmarks/bench_embedding_backends.py --texts 512 --queries 200
+    python benchmarks/bench_embedding_backends.py --backends torch onnx-int8 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_texts  # noqa: E402
+from app.utils.embedding_backends import (  # noqa: E402
+    create_embedding_backend, EMBEDDING_BACKENDS, EMBEDDING_MODEL_NAME
+)
+
+
+def bench_backend(backend, texts, queries, batch_size):
+    backend.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+
+    start = time.perf_counter()
+    embeddings = backend.encode(texts, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        backend.encode([query])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return embeddings, {
+        "texts_per_sec": round(len(texts) / batch_seconds, 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "query_p99_ms": round(float(np.percentile(latencies, 99)), 2)
+    }
+
+
+def cosine_agreement(reference: np.ndarray, embeddings: np.ndarray) -> dict:
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    cosines = (reference * embeddings).sum(axis=1)
+    return {"cosine_mean": round(float(cosines.mean()), 6), "cosine_min": round(float(cosines.min()), 6)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--texts", type=int, default=512, help="chunk texts encoded in batches")
+    parser.add_argument("--queries", type=int, default=200, help="single-text encodes timed for latency")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts)
+    queries = make_texts(args.queries, min_words=4, max_words=20, seed=1)
+
+    backends = list(args.backends)
+    if "torch" in backends:
+        # The reference runs first so every other backend can be compared against it
+        backends.remove("torch")
+        backends.insert(0, "torch")
+
+    reference = None
+    results = []
+    for name in backends:
+        backend = create_embedding_backend(name, args.model)
+        embeddings, result = bench_backend(backend, texts, queries, args.batch_size)
+        if name == "torch":
+            reference = embeddings
+        if reference is not None:
+            result.update(cosine_agreement(reference, embeddings))
+        results.append(dict(backend=name, **result))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.model}: {args.texts} texts (batch {args.batch_size}), {args.queries} single queries")
+    print(f"{'backend':<10} {'texts/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'cos mean':>9} {'cos min':>9}")
+    for r in results:
+        print(f"{r['backend']:<10} {r['texts_per_sec']:>9} {r['query_p50_ms']:>8} {r['query_p99_ms']:>8} "
+              f"{r.get('cosine_mean', '-'):>9} {r.get('cosine_min', '-'):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Import-time benchmark and guard for app startup
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters and
+reports the module's import time (interpreter startup subtracted), the slowest imports and whether
+any heavy ML / OCR / PDF library was imported eagerly. Exits non-zero when a
+heavy library is imported at startup or the median import time exceeds
+--budget-ms, so it can guard startup time in CI.
+
+Usage:
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --module app.routers.auth_router --budget-ms 800
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must only be imported on first use (see app/utils/lazy_imports.py)
+HEAVY_MODULES = (
+    "faiss", "torch", "sentence_transformers", "transformers", "onnxruntime",
+    "cv2", "pytesseract", "pdf2image", "pdfplumber", "PyPDF2", "fitz"
+)
+
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(statement: str) -> dict:
+    """One fresh-interpreter run of statement, parsed from -X importtime output"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{statement} failed:\n{result.stderr.splitlines()[-1] if result.stderr else ''}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append({"name": name, "self_us": int(self_us), "cumulative_us": int(cumulative_us), "depth": len(indent) // 2})
+
+    # Top-level entries' cumulative times add up to everything imported by the run
+    total_us = sum(entry["cumulative_us"] for entry in imports if entry["depth"] == 0)
+    return {"total_ms": total_us / 1000, "imports": imports}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail above this median import time")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    # Interpreter startup (site, encodings, ...) is measured separately and subtracted
+    baseline_ms = statistics.median(measure("pass")["total_ms"] for _ in range(args.runs))
+    runs = [measure(f"import {args.module}") for _ in range(args.runs)]
+    times_ms = [run["total_ms"] - baseline_ms for run in runs]
+    median_ms = statistics.median(times_ms)
+
+    last = runs[-1]["imports"]
+    roots = {entry["name"].split(".")[0] for entry in last}
+    heavy = sorted(name for name in HEAVY_MODULES if name in roots)
+    slowest = sorted(last, key=lambda entry: entry["self_us"], reverse=True)[:args.top]
+
+    over_budget = args.budget_ms is not None and median_ms > args.budget_ms
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "median_ms": round(median_ms, 1),
+        "min_ms": round(min(times_ms), 1),
+        "budget_ms": args.budget_ms,
+        "heavy_imports": heavy,
+        "slowest": [{"name": e["name"], "self_ms": round(e["self_us"] / 1000, 1)} for e in slowest],
+        "ok": not heavy and not over_budget
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import {args.module}: median {report['median_ms']} ms, min {report['min_ms']} ms over {args.runs} runs")
+        print(f"{'module':<50} {'self ms':>8}")
+        for entry in report["slowest"]:
+            print(f"{entry['name']:<50} {entry['self_ms']:>8}")
+        if heavy:
+            print(f"FAIL: heavy modules imported at startup: {', '.join(heavy)}")
+        if over_budget:
+            print(f"FAIL: median import time {report['median_ms']} ms exceeds budget {args.budget_ms} ms")
+
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Compressed index benchmark: memory saved vs recall@k lost against the exact index
+
+Builds the exact IndexFlatIP and every supported compression (sq8, fp16, pq)
+over a synthetic clustered corpus and reports serialized size, savings and
+recall@k against exact search.
+
+Usage:
+    python benchmarks/bench_index_compression.py --vectors 20000 --k 5
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_corpus, make_queries, recall_at_k  # noqa: E402
+from app.utils.faiss_indexes import (  # noqa: E402
+    build_index, describe_index_type, index_size_bytes, PQ_MIN_TRAIN_VECTORS
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--index-type", default="flat", choices=["flat", "ivf", "hnsw"])
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.vectors, args.dimension)
+    queries = make_queries(corpus, args.queries)
+
+    exact = build_index("flat", corpus)
+    _, expected = exact.search(queries, args.k)
+    exact_bytes = index_size_bytes(exact)
+
+    compressions = ["none", "sq8", "fp16"]
+    if args.vectors >= PQ_MIN_TRAIN_VECTORS and args.index_type != "hnsw":
+        compressions.append("pq")
+
+    results = []
+    for compression in compressions:
+        index = build_index(args.index_type, corpus, compression)
+        _, found = index.search(queries, args.k)
+        size = index_size_bytes(index)
+        results.append({
+            "index": describe_index_type(index),
+            "compression": compression,
+            "bytes": size,
+            "bytes_per_vector": round(size / args.vectors, 1),
+            "saved_pct": round(100.0 * (1 - size / exact_bytes), 1),
+            f"recall@{args.k}": round(recall_at_k(expected, found), 4)
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.vectors} x {args.dimension}d vectors, {args.queries} queries, exact index {exact_bytes / 1e6:.1f} MB")
+    print(f"{'index':<12} {'MB':>8} {'B/vector':>9} {'saved %':>8} {f'recall@{args.k}':>10}")
+    for r in results:
+        print(f"{r['index']:<12} {r['bytes'] / 1e6:>8.2f} {r['bytes_per_vector']:>9} "
+              f"{r['saved_pct']:>8} {r[f'recall@{args.k}']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Memory benchmark: heap-loaded vs memory-mapped FAISS indexes across worker processes
+
+Builds M synthetic textbook indexes, then starts N worker processes that each load
+and search all of them (like N uvicorn workers serving the same textbooks), and
+reports per-worker RSS/PSS and the total for each load mode.
+
+PSS splits shared pages between the processes mapping them, so its total is the
+real memory cost of the worker pool; RSS counts shared pages in every worker.
+
+Usage:
+    python benchmarks/bench_index_memory.py --workers 4 --textbooks 8 --vectors 20000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.faiss_indexes import build_index, read_index, INDEX_LOAD_MODES  # noqa: E402
+
+
+def read_memory_kb() -> dict:
+    """Current process RSS and PSS in kB (Linux /proc)"""
+    memory = {"rss_kb": 0, "pss_kb": 0}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                memory["rss_kb"] = int(line.split()[1])
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    memory["pss_kb"] = int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return memory
+
+
+def worker(mode, index_paths, dimension, ready, done, results):
+    baseline = read_memory_kb()
+
+    try:
+        indexes = [read_index(path, mode) for path in index_paths]
+
+        # Touch every index with a search so mapped pages are actually faulted in
+        queries = np.random.default_rng(os.getpid()).standard_normal((16, dimension)).astype("float32")
+        faiss.normalize_L2(queries)
+        for index in indexes:
+            index.search(queries, 5)
+        error = None
+    except Exception as e:
+        error = str(e)
+
+    # Measure only once every worker has loaded, so shared pages are split fairly
+    ready.wait()
+    loaded = read_memory_kb()
+    results.put({
+        "rss_kb": loaded["rss_kb"] - baseline["rss_kb"],
+        "pss_kb": loaded["pss_kb"] - baseline["pss_kb"],
+        "error": error
+    })
+    done.wait()
+
+
+def run_mode(mode, index_paths, dimension, workers):
+    # Fresh interpreters, so workers do not inherit the parent's build-time memory
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Barrier(workers + 1)
+    done = ctx.Event()
+    results = ctx.Queue()
+
+    processes = [
+        ctx.Process(target=worker, args=(mode, index_paths, dimension, ready, done, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    ready.wait()
+
+    per_worker = [results.get() for _ in range(workers)]
+    done.set()
+    for process in processes:
+        process.join()
+
+    errors = [r["error"] for r in per_worker if r["error"]]
+    if errors:
+        raise RuntimeError(f"{mode} workers failed: {errors[0]}")
+
+    return {
+        "mode": mode,
+        "workers": workers,
+        "textbooks": len(index_paths),
+        "per_worker_rss_mb": round(np.mean([r["rss_kb"] for r in per_worker]) / 1024, 1),
+        "total_rss_mb": round(sum(r["rss_kb"] for r in per_worker) / 1024, 1),
+        "total_pss_mb": round(sum(r["pss_kb"] for r in per_worker) / 1024, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--textbooks", type=int, default=8)
+    parser.add_argument("--vectors", type=int, default=20000, help="vectors per textbook")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--index-type", default="flat", choices=["flat", "ivf", "hnsw"])
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_paths = []
+        for i in range(args.textbooks):
+            embeddings = rng.standard_normal((args.vectors, args.dimension)).astype("float32")
+            faiss.normalize_L2(embeddings)
+            path = os.path.join(tmp_dir, f"textbook_{i}.index")
+            faiss.write_index(build_index(args.index_type, embeddings), path)
+            index_paths.append(path)
+
+        results = [run_mode(mode, index_paths, args.dimension, args.workers) for mode in INDEX_LOAD_MODES]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    index_mb = args.vectors * args.dimension * 4 * args.textbooks / (1024 * 1024)
+    print(f"{args.workers} workers x {args.textbooks} {args.index_type} textbooks "
+          f"({args.vectors} x {args.dimension}d, {index_mb:.1f} MB of vectors)")
+    print(f"{'mode':<8} {'RSS/worker MB':>14} {'total RSS MB':>13} {'total PSS MB':>13}")
+    for result in results:
+        print(f"{result['mode']:<8} {result['per_worker_rss_mb']:>14} "
+              f"{result['total_rss_mb']:>13} {result['total_pss_mb']:>13}")
+
+
+if __name__ == "__main__":
+    main()
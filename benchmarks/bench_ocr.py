@@ -0,0 +1,115 @@
+"""OCR throughput benchmark: pages/second against OCR worker count
+
+Runs page preprocessing + Tesseract over the same pages with 1, 2, 4, ... worker
+processes (the upload path's process pool) and reports pages/second, speedup
+over one worker and whether the output matches the single-worker run.
+
+Pages come from a PDF (--pdf, rendered at --dpi) or are synthetic letter-size
+pages of rendered text.
+
+Usage:
+    python benchmarks/bench_ocr.py --pages 16 --workers 1,2,4,8
+    python benchmarks/bench_ocr.py --pdf fixtures/scanned.pdf --pages 20
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import textwrap
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_texts  # noqa: E402
+from app.utils.lazy_imports import get_cv2  # noqa: E402
+from app.utils.pdf_processor import iter_ocr_pages, ocr_page, page_renderer, _init_ocr_worker  # noqa: E402
+
+
+def make_pages(count: int, width: int = 1700, height: int = 2200) -> list:
+    """Letter-size grayscale pages (200 dpi) with 30 lines of rendered text each"""
+    cv2 = get_cv2()
+    paragraphs = make_texts(count * 6, min_words=40, max_words=80)
+    pages = []
+    for i in range(count):
+        lines = textwrap.wrap(" ".join(paragraphs[i * 6:(i + 1) * 6]), 60)[:30]
+        page = np.full((height, width), 255, dtype=np.uint8)
+        for row, line in enumerate(lines):
+            cv2.putText(page, line, (100, 150 + row * 65), cv2.FONT_HERSHEY_SIMPLEX, 1.3, 0, 2)
+        pages.append(page)
+    return pages
+
+
+def load_pdf_pages(path: str, count: int, dpi: int) -> list:
+    with page_renderer(path, dpi) as render_page:
+        return [render_page(page_number) for page_number in range(1, count + 1)]
+
+
+def run(pages: list, workers: int) -> tuple:
+    """(seconds, texts) to OCR all pages with the given number of worker processes"""
+    if workers == 1:
+        # Same in-process path the upload uses for a single worker
+        start = time.perf_counter()
+        texts = list(iter_ocr_pages(pages, 1))
+        return time.perf_counter() - start, texts
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_ocr_worker
+    ) as pool:
+        # Start every worker and import OpenCV/pytesseract before timing
+        list(pool.map(ocr_page, pages[:1] * workers))
+
+        start = time.perf_counter()
+        texts = list(iter_ocr_pages(pages, workers, executor=pool))
+        return time.perf_counter() - start, texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--workers", default=None, help="comma-separated worker counts (default: 1, 2, 4, ... up to the cores)")
+    parser.add_argument("--pdf", default=None, help="OCR the first --pages pages of this PDF")
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(",")]
+    else:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= (os.cpu_count() or 1):
+            worker_counts.append(worker_counts[-1] * 2)
+
+    pages = load_pdf_pages(args.pdf, args.pages, args.dpi) if args.pdf else make_pages(args.pages)
+
+    results = []
+    reference = None
+    for workers in worker_counts:
+        seconds, texts = run(pages, workers)
+        reference = reference if reference is not None else texts
+        results.append({
+            "workers": workers,
+            "pages": len(pages),
+            "seconds": round(seconds, 3),
+            "pages_per_second": round(len(pages) / seconds, 2),
+            "speedup": round(results[0]["seconds"] / seconds, 2) if results else 1.0,
+            "same_output": texts == reference
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{len(pages)} pages ({args.pdf or 'synthetic'}), {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'seconds':>9} {'pages/s':>8} {'speedup':>8} {'same output':>12}")
+    for result in results:
+        print(f"{result['workers']:>8} {result['seconds']:>9} {result['pages_per_second']:>8} "
+              f"{result['speedup']:>8} {str(result['same_output']):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""PDF text extractor benchmark: throughput and text parity of pymupdf vs pdfplumber
+
+Runs every text-layer extractor over the same PDFs the way uploads do (page by
+page, text + image coverage) and reports pages/second, speedup over pdfplumber
+and, per page, how closely each extractor's text matches pdfplumber's (word
+F1, order-insensitive) and whether it makes the same OCR decision. pdfplumber is
+the reference because existing textbooks were chunked from its output.
+
+PDFs come from --pdf (fixture files) or a synthetic textbook is generated with
+PyMuPDF: single and two-column text pages plus image-only (scanned) pages.
+
+Usage:
+    python benchmarks/bench_pdf_extractors.py --pages 200
+    python benchmarks/bench_pdf_extractors.py --pdf fixtures/biology.pdf fixtures/history.pdf --json
+"""
+import argparse
+import json
+import os
+import sys
+import textwrap
+import time
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_texts  # noqa: E402
+from app.utils.lazy_imports import get_fitz  # noqa: E402
+from app.utils.pdf_processor import create_pdf_extractor, iter_pdf_pages, PDF_EXTRACTORS  # noqa: E402
+
+REFERENCE = "pdfplumber"
+
+
+def make_pdf(page_count: int, scanned_every: int = 10) -> bytes:
+    """Letter-size synthetic textbook; every scanned_every-th page is an image without a text layer"""
+    fitz = get_fitz()
+    paragraphs = make_texts(page_count * 5, min_words=30, max_words=90)
+    scan = np.full((550, 425, 3), 255, dtype=np.uint8)
+    scan[100:450, 60:365] = 40
+    scan_pixmap = fitz.Pixmap(fitz.csRGB, 425, 550, scan.tobytes(), False)
+
+    document = fitz.open()
+    for i in range(page_count):
+        page = document.new_page(width=612, height=792)
+        if scanned_every and i % scanned_every == scanned_every - 1:
+            page.insert_image(page.rect, pixmap=scan_pixmap)
+            continue
+        text = "\n\n".join(paragraphs[i * 5:(i + 1) * 5])
+        if i % 2:
+            # Two columns
+            half = len(text) // 2
+            page.insert_textbox(fitz.Rect(50, 50, 296, 742), text[:half], fontsize=10)
+            page.insert_textbox(fitz.Rect(316, 50, 562, 742), text[half:], fontsize=10)
+        else:
+            page.insert_text((50, 40), f"Chapter {i // 20 + 1}", fontsize=14)
+            page.insert_textbox(fitz.Rect(50, 60, 562, 742), text, fontsize=11)
+    content = document.tobytes()
+    document.close()
+    return content
+
+
+def word_f1(reference: str, text: str) -> float:
+    """Order-insensitive word overlap (1.0 = same words)"""
+    expected, found = Counter(reference.split()), Counter(text.split())
+    if not expected and not found:
+        return 1.0
+    overlap = sum((expected & found).values())
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / sum(found.values()), overlap / sum(expected.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def run(source, extractor_name: str, repeats: int) -> tuple:
+    """(best seconds over repeats, pages) for one pass over the PDF"""
+    extractor = create_pdf_extractor(extractor_name)
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        pages = list(iter_pdf_pages(source, extractor))
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, pages
+
+
+def bench_pdf(name: str, source, extractors: list, repeats: int) -> list:
+    runs = {extractor: run(source, extractor, repeats) for extractor in extractors}
+    reference_seconds, reference_pages = runs.get(REFERENCE, (None, None))
+
+    results = []
+    for extractor, (seconds, pages) in runs.items():
+        result = {
+            "pdf": name,
+            "extractor": extractor,
+            "pages": len(pages),
+            "seconds": round(seconds, 3),
+            "pages_per_second": round(len(pages) / seconds, 1),
+            "chars": sum(len(page["text"]) for page in pages),
+            "ocr_pages": sum(page["needs_ocr"] for page in pages)
+        }
+        if reference_pages is not None and len(reference_pages) == len(pages):
+            scores = [word_f1(expected["text"], page["text"]) for expected, page in zip(reference_pages, pages)]
+            result.update({
+                "speedup": round(reference_seconds / seconds, 2),
+                "word_f1_mean": round(float(np.mean(scores)), 4),
+                "word_f1_min": round(float(np.min(scores)), 4),
+                "same_ocr_decision": round(float(np.mean([
+                    expected["needs_ocr"] == page["needs_ocr"] for expected, page in zip(reference_pages, pages)
+                ])), 4)
+            })
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf", nargs="+", default=None, help="fixture PDFs (default: a synthetic textbook)")
+    parser.add_argument("--pages", type=int, default=100, help="pages of the synthetic textbook")
+    parser.add_argument("--extractors", nargs="+", default=list(PDF_EXTRACTORS), choices=PDF_EXTRACTORS)
+    parser.add_argument("--repeats", type=int, default=3, help="passes per extractor (best is reported)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    if args.pdf:
+        # Read from the file, like uploads
+        sources = [(os.path.basename(path), path) for path in args.pdf]
+    else:
+        sources = [(f"synthetic-{args.pages}p", make_pdf(args.pages))]
+
+    results = []
+    for name, source in sources:
+        results.extend(bench_pdf(name, source, args.extractors, args.repeats))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'pdf':<24} {'extractor':<11} {'pages':>6} {'pages/s':>9} {'speedup':>8} "
+          f"{'F1 mean':>8} {'F1 min':>7} {'same OCR':>9}")
+    for result in results:
+        print(f"{textwrap.shorten(result['pdf'], 24):<24} {result['extractor']:<11} {result['pages']:>6} "
+              f"{result['pages_per_second']:>9} {result.get('speedup', '-'):>8} "
+              f"{result.get('word_f1_mean', '-'):>8} {result.get('word_f1_min', '-'):>7} "
+              f"{result.get('same_ocr_decision', '-'):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""OCR rasterization benchmark: ms/page of PyMuPDF grayscale vs pdf2image + color conversions
+
+Renders the same PDF pages the way OCR input used to be produced (pdf2image /
+pdftoppm subprocess -> PIL RGB -> numpy -> BGR -> grayscale) and the way it is
+now (PyMuPDF in-process, straight to a grayscale buffer) and reports ms/page,
+the per-page speedup and how far the two images differ (mean absolute pixel
+difference, 0-255).
+
+pdf2image needs poppler's pdftoppm on the PATH; without it only the PyMuPDF
+timings (and the cost of the RGB -> grayscale conversions it replaces) are shown.
+
+Usage:
+    python benchmarks/bench_rasterize.py --pages 20 --dpi 200
+    python benchmarks/bench_rasterize.py --pdf fixtures/scanned.pdf --dpi 300 --json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_pdf_extractors import make_pdf  # noqa: E402
+from app.utils.lazy_imports import get_convert_from_path, get_cv2, get_fitz  # noqa: E402
+from app.utils.pdf_processor import page_renderer  # noqa: E402
+
+
+def render_pdf2image(path: str, page_number: int, dpi: int) -> np.ndarray:
+    """The previous OCR input path"""
+    cv2 = get_cv2()
+    image = np.array(get_convert_from_path()(path, dpi=dpi, first_page=page_number, last_page=page_number)[0])
+    return cv2.cvtColor(cv2.cvtColor(image, cv2.COLOR_RGB2BGR), cv2.COLOR_BGR2GRAY)
+
+
+def render_pymupdf_rgb(document, page_number: int, dpi: int) -> np.ndarray:
+    """PyMuPDF RGB render followed by the old color conversions (isolates their cost)"""
+    cv2 = get_cv2()
+    pixmap = document.load_page(page_number - 1).get_pixmap(dpi=dpi, alpha=False)
+    image = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)
+    image = image[:, :pixmap.width * 3].reshape(pixmap.height, pixmap.width, 3)
+    return cv2.cvtColor(cv2.cvtColor(image, cv2.COLOR_RGB2BGR), cv2.COLOR_BGR2GRAY)
+
+
+def time_pages(render, pages: list) -> tuple:
+    """(per-page ms, images)"""
+    render(pages[0])  # warm-up
+    timings, images = [], []
+    for page_number in pages:
+        start = time.perf_counter()
+        images.append(render(page_number))
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings), images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf", default=None, help="PDF to render (default: a synthetic textbook)")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.pdf
+        if path is None:
+            path = os.path.join(tmp, "synthetic.pdf")
+            with open(path, "wb") as f:
+                f.write(make_pdf(args.pages))
+
+        fitz = get_fitz()
+        with fitz.open(path) as document:
+            pages = list(range(1, min(args.pages, document.page_count) + 1))
+            runs = {}
+            with page_renderer(path, args.dpi) as render_page:
+                runs["pymupdf-gray"] = time_pages(render_page, pages)
+            runs["pymupdf-rgb+convert"] = time_pages(lambda n: render_pymupdf_rgb(document, n, args.dpi), pages)
+        if shutil.which("pdftoppm"):
+            runs["pdf2image"] = time_pages(lambda n: render_pdf2image(path, n, args.dpi), pages)
+        else:
+            print("pdftoppm not found, skipping pdf2image", file=sys.stderr)
+
+    reference = runs.get("pdf2image")
+    results = []
+    for name, (timings, images) in runs.items():
+        result = {
+            "renderer": name,
+            "pages": len(pages),
+            "dpi": args.dpi,
+            "ms_per_page": round(float(timings.mean()), 2),
+            "p50_ms": round(float(np.percentile(timings, 50)), 2),
+            "shape": list(images[0].shape)
+        }
+        if reference is not None:
+            result["speedup"] = round(float(reference[0].mean() / timings.mean()), 2)
+            same_shape = [a.shape == b.shape for a, b in zip(reference[1], images)]
+            if all(same_shape):
+                result["mean_abs_diff"] = round(float(np.mean([
+                    np.abs(a.astype(np.int16) - b.astype(np.int16)).mean() for a, b in zip(reference[1], images)
+                ])), 3)
+        results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{len(pages)} pages at {args.dpi} dpi ({args.pdf or 'synthetic'})")
+    print(f"{'renderer':<21} {'ms/page':>8} {'p50 ms':>8} {'speedup':>8} {'mean |diff|':>12}")
+    for result in results:
+        print(f"{result['renderer']:<21} {result['ms_per_page']:>8} {result['p50_ms']:>8} "
+              f"{result.get('speedup', '-'):>8} {result.get('mean_abs_diff', '-'):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Retrieval benchmark: recall@k vs query latency for every index configuration and corpus size
+
+For each corpus size, builds every supported index configuration (flat, IVF and
+HNSW, uncompressed and quantized) the way textbooks are indexed, runs a fixed
+query set one query at a time (as the API does) and reports recall@k against
+exact search, p50/p99 query latency, build time and index memory. IVF and HNSW
+are also swept over nprobe / efSearch to show the recall/latency trade-off.
+
+The corpus is synthetic (clustered, see synthetic.py) unless --fixture points to
+an .npy file of real chunk embeddings, whose first N rows are used per size.
+
+Results can be written as JSON (--output) and compared against a previous run
+(--baseline); the exit status is 1 when recall or latency regressed.
+
+Usage:
+    python benchmarks/bench_retrieval.py --sizes 1000,10000,50000 --output retrieval.json
+    python benchmarks/bench_retrieval.py --baseline retrieval.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_corpus, make_queries, recall_at_k  # noqa: E402
+from bench_index_memory import read_memory_kb  # noqa: E402
+from app.utils.faiss_indexes import (  # noqa: E402
+    build_index, describe_index_type, index_size_bytes, get_search_params,
+    PQ_MIN_TRAIN_VECTORS, DEFAULT_NPROBE, DEFAULT_EF_SEARCH
+)
+
+# (index type, compression) pairs; pq needs PQ_MIN_TRAIN_VECTORS to train and is not built with hnsw
+CONFIGURATIONS = [
+    ("flat", "none"), ("flat", "fp16"), ("flat", "sq8"), ("flat", "pq"),
+    ("ivf", "none"), ("ivf", "sq8"), ("ivf", "pq"),
+    ("hnsw", "none"), ("hnsw", "sq8"),
+]
+
+
+def parse_ints(value: str) -> list:
+    return [int(item) for item in value.split(",") if item]
+
+
+def measure_latencies(index, queries: np.ndarray, k: int, params, warmup: int = 10) -> tuple:
+    """Per-query search latencies in ms (queries run one at a time) and the returned ids"""
+    for query in queries[:warmup]:
+        index.search(query[None, :], k, params=params)
+
+    latencies = np.empty(len(queries))
+    found = np.empty((len(queries), k), dtype="int64")
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k, params=params)
+        latencies[i] = (time.perf_counter() - start) * 1000
+        found[i] = ids[0]
+    return latencies, found
+
+
+def search_settings(index_type: str, nprobes: list, ef_searches: list) -> list:
+    """(label, nprobe, efSearch) per search setting swept for an index type"""
+    if index_type == "ivf":
+        return [(f"nprobe={nprobe}", nprobe, None) for nprobe in nprobes]
+    if index_type == "hnsw":
+        return [(f"efSearch={ef_search}", None, ef_search) for ef_search in ef_searches]
+    return [("", None, None)]
+
+
+def bench_size(corpus: np.ndarray, queries: np.ndarray, args, build_threads: int) -> list:
+    vector_count = corpus.shape[0]
+    exact = build_index("flat", corpus)
+    _, expected = exact.search(queries, args.k)
+
+    results = []
+    for index_type, compression in CONFIGURATIONS:
+        if compression == "pq" and vector_count < PQ_MIN_TRAIN_VECTORS:
+            continue
+
+        faiss.omp_set_num_threads(build_threads)
+        memory_before = read_memory_kb()["rss_kb"]
+        start = time.perf_counter()
+        index = build_index(index_type, corpus, compression)
+        build_seconds = time.perf_counter() - start
+        rss_delta_kb = read_memory_kb()["rss_kb"] - memory_before
+        size = index_size_bytes(index)
+        faiss.omp_set_num_threads(args.threads)
+
+        for label, nprobe, ef_search in search_settings(index_type, args.nprobe, args.ef_search):
+            params = get_search_params(index, nprobe, ef_search)
+            latencies, found = measure_latencies(index, queries, args.k, params)
+            results.append({
+                "vectors": vector_count,
+                "dimension": corpus.shape[1],
+                "index": describe_index_type(index),
+                "index_type": index_type,
+                "compression": compression,
+                "search": label,
+                "k": args.k,
+                f"recall@{args.k}": round(recall_at_k(expected, found), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+                "mean_ms": round(float(latencies.mean()), 4),
+                "build_s": round(build_seconds, 3),
+                "index_bytes": size,
+                "bytes_per_vector": round(size / vector_count, 1),
+                "rss_delta_mb": round(rss_delta_kb / 1024, 1)
+            })
+        del index
+
+    return results
+
+
+def result_key(result: dict) -> tuple:
+    return result["vectors"], result["dimension"], result["index"], result["search"]
+
+
+def compare_to_baseline(results: list, baseline: dict, k: int, max_recall_drop: float, max_latency_increase: float) -> list:
+    """Human-readable regressions of results against a previous run's JSON output"""
+    previous = {result_key(result): result for result in baseline["results"]}
+    recall = f"recall@{k}"
+    regressions = []
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None or recall not in old:
+            continue
+        name = f"{result['vectors']} {result['index']} {result['search']}".strip()
+        if old[recall] - result[recall] > max_recall_drop:
+            regressions.append(f"{name}: {recall} {old[recall]} -> {result[recall]}")
+        if result["p50_ms"] > old["p50_ms"] * (1 + max_latency_increase):
+            regressions.append(f"{name}: p50 {old['p50_ms']}ms -> {result['p50_ms']}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=parse_ints, default=parse_ints("1000,10000,50000"), help="corpus sizes")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=parse_ints, default=[4, DEFAULT_NPROBE, 64], help="IVF nprobe sweep")
+    parser.add_argument("--ef-search", type=parse_ints, default=[16, DEFAULT_EF_SEARCH, 256], help="HNSW efSearch sweep")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads while searching (1 = stable latencies)")
+    parser.add_argument("--fixture", default=None, help=".npy file of real embeddings instead of the synthetic corpus")
+    parser.add_argument("--output", default=None, help="write machine-readable results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="JSON output of a previous run to compare against")
+    parser.add_argument("--max-recall-drop", type=float, default=0.01)
+    parser.add_argument("--max-latency-increase", type=float, default=0.5, help="allowed p50 increase (0.5 = +50%%)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    # Indexes are built with all cores, like at upload time
+    build_threads = faiss.omp_get_max_threads()
+
+    fixture = None
+    if args.fixture:
+        fixture = np.ascontiguousarray(np.load(args.fixture), dtype="float32")
+        faiss.normalize_L2(fixture)
+        args.dimension = fixture.shape[1]
+
+    results = []
+    for size in args.sizes:
+        if fixture is not None:
+            if size > fixture.shape[0]:
+                print(f"Skipping {size}: fixture has {fixture.shape[0]} vectors", file=sys.stderr)
+                continue
+            corpus = fixture[:size]
+        else:
+            corpus = make_corpus(size, args.dimension)
+        # Same query set for every configuration of a size
+        queries = make_queries(corpus, args.queries)
+        results.extend(bench_size(corpus, queries, args, build_threads))
+
+    report = {
+        "benchmark": "retrieval",
+        "created_at": time.time(),
+        "environment": {
+            "faiss": faiss.__version__,
+            "numpy": np.__version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "threads": args.threads
+        },
+        "corpus": args.fixture or "synthetic",
+        "queries": args.queries,
+        "k": args.k,
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        recall = f"recall@{args.k}"
+        print(f"{args.queries} queries, k={args.k}, {args.threads} thread(s), {report['corpus']} corpus")
+        print(f"{'vectors':>8} {'index':<10} {'search':<13} {recall:>9} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'build s':>8} {'MB':>8} {'B/vec':>7}")
+        for result in results:
+            print(f"{result['vectors']:>8} {result['index']:<10} {result['search']:<13} {result[recall]:>9} "
+                  f"{result['p50_ms']:>8} {result['p99_ms']:>8} {result['build_s']:>8} "
+                  f"{result['index_bytes'] / (1024 * 1024):>8.1f} {result['bytes_per_vector']:>7}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(
+            results, baseline, args.k, args.max_recall_drop, args.max_latency_increase
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()